@@ -0,0 +1,134 @@
+import hashlib
+import os
+import sys
+
+import psycopg2
+from psycopg2.extras import Json, execute_values
+
+from database_connection import get_connection
+from get_affiliation import AFFILIATION_MODEL, EXTRACTION_VERSION
+
+
+def pdf_digest(pdf_path: str) -> str:
+    """
+    Hashes the content of a PDF file, so that identical files share cache entries
+    whatever their name.
+    """
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as pdf:
+        for chunk in iter(lambda: pdf.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_cached_affiliations(
+    cursor: psycopg2.extensions.cursor, digests: list[str]
+) -> dict[str, list[tuple[str, str]]]:
+    """
+    Looks up the affiliations extracted with the current model and prompt from PDFs,
+    in a single query.
+
+    Returns the (author name, affiliation) pairs for each cached PDF digest.
+    """
+    cursor.execute(
+        """
+        SELECT pdf_sha256, affiliations
+        FROM affiliation_cache
+        WHERE pdf_sha256 = ANY(%s) AND extraction_version = %s
+        """,
+        (digests, EXTRACTION_VERSION),
+    )
+    return {
+        digest: [(author, affiliation) for author, affiliation in affiliations]
+        for digest, affiliations in cursor.fetchall()
+    }
+
+
+def store_affiliations(
+    cursor: psycopg2.extensions.cursor,
+    results: dict[str, list[tuple[str, str]]],
+) -> None:
+    """
+    Caches the affiliations extracted from PDFs, keyed by their digest. Empty answers
+    are left out, so that the next run asks again.
+    """
+    execute_values(
+        cursor,
+        """
+        INSERT INTO affiliation_cache
+            (pdf_sha256, extraction_version, model, affiliations, created_at)
+        VALUES %s
+        ON CONFLICT (pdf_sha256, extraction_version) DO UPDATE SET
+            affiliations = EXCLUDED.affiliations,
+            created_at = EXCLUDED.created_at
+        """,
+        [
+            (digest, EXTRACTION_VERSION, AFFILIATION_MODEL, Json(affiliations))
+            for digest, affiliations in results.items()
+            if affiliations
+        ],
+        template="(%s, %s, %s, %s, now())",
+    )
+
+
+def forget_affiliations(cursor: psycopg2.extensions.cursor, digests: list[str]) -> int:
+    """
+    Drops the cached affiliations of PDFs, whatever the version they were extracted
+    with.
+
+    Returns the number of entries removed.
+    """
+    cursor.execute(
+        "DELETE FROM affiliation_cache WHERE pdf_sha256 = ANY(%s)", (digests,)
+    )
+    return int(cursor.rowcount)
+
+
+def main() -> None:
+    if len(sys.argv) < 2 or sys.argv[1] not in ("list", "prune", "show", "forget"):
+        print("Usage: python affiliation_cache.py list|prune")
+        print("       python affiliation_cache.py show|forget <pdf or digest>...")
+        sys.exit(1)
+
+    # Entries can be named by the PDF they were extracted from, or by digest.
+    digests = [pdf_digest(arg) if os.path.isfile(arg) else arg for arg in sys.argv[2:]]
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if sys.argv[1] == "list":
+            cursor.execute("""
+                SELECT extraction_version, model, COUNT(*), MAX(created_at)
+                FROM affiliation_cache
+                GROUP BY extraction_version, model
+                ORDER BY MAX(created_at) DESC
+                """)
+            print(f"Current version: {EXTRACTION_VERSION}")
+            for version, model, count, last_created in cursor.fetchall():
+                print(f"{version} ({model}): {count} entries, last on {last_created}")
+        elif sys.argv[1] == "prune":
+            cursor.execute(
+                "DELETE FROM affiliation_cache WHERE extraction_version <> %s",
+                (EXTRACTION_VERSION,),
+            )
+            print(f"Removed {cursor.rowcount} entries of previous versions.")
+        elif sys.argv[1] == "show":
+            cursor.execute(
+                """
+                SELECT pdf_sha256, extraction_version, model, created_at, affiliations
+                FROM affiliation_cache
+                WHERE pdf_sha256 = ANY(%s)
+                ORDER BY created_at DESC
+                """,
+                (digests,),
+            )
+            for digest, version, model, created_at, affiliations in cursor.fetchall():
+                print(f"{digest} {version} ({model}, {created_at}):")
+                for author, affiliation in affiliations:
+                    print(f"  {author}: {affiliation}")
+        else:
+            removed = forget_affiliations(cursor, digests)
+            print(f"Removed {removed} cache entries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import argparse
+import base64
+import json
+import os
+import time
+from typing import Any, Final, Optional
+
+import psycopg2
+from openai import OpenAI
+from openai.types import Batch
+
+from database_connection import get_connection, run_with_retry
+from migrate import refresh_export_view
+from affiliation_cache import get_cached_affiliations, store_affiliations
+from canonicalize_affiliations import load_affiliation_index
+from extract_first_page_of_pdf import (
+    extract_first_page_of_pdf_to_bytes,
+    extract_first_page_text,
+)
+from fill_affiliations import (
+    get_papers_to_process,
+    get_pdf_digests,
+    get_pdf_path,
+    print_paper,
+    save_paper_affiliations,
+)
+from get_affiliation import (
+    AFFILIATION_MODEL,
+    build_affiliation_messages,
+    build_affiliation_text_messages,
+    get_default_client,
+    is_usable_text,
+    parse_affiliations,
+)
+
+BATCH_ENDPOINT: Final = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW: Final = "24h"
+DEFAULT_POLL_INTERVAL = 60.0
+# Statuses after which a batch makes no more progress.
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_batch_request(doi: str, pdf_path: str) -> dict[str, Any]:
+    """
+    Builds the batch request line for a paper. The text of the first page is sent,
+    or for scanned papers the page itself, inline, so no file has to be uploaded per
+    paper.
+    """
+    text = extract_first_page_text(pdf_path)
+    if is_usable_text(text):
+        messages = build_affiliation_text_messages(text)
+    else:
+        data = base64.b64encode(extract_first_page_of_pdf_to_bytes(pdf_path)).decode()
+        messages = build_affiliation_messages(
+            {
+                "filename": f"{doi.replace('/', '_')}.pdf",
+                "file_data": f"data:application/pdf;base64,{data}",
+            }
+        )
+    return {
+        "custom_id": doi,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {"model": AFFILIATION_MODEL, "messages": messages},
+    }
+
+
+def submit_batch(
+    client: OpenAI, requests: list[dict[str, Any]], description: str
+) -> Batch:
+    """
+    Uploads the requests as a single JSONL file and starts a batch job over them.
+    """
+    content = "".join(json.dumps(request) + "\n" for request in requests)
+    input_file = client.files.create(
+        file=("affiliations.jsonl", content.encode()), purpose="batch"
+    )
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+        metadata={"description": description},
+    )
+
+
+def wait_for_batch(client: OpenAI, batch_id: str, poll_interval: float) -> Batch:
+    """
+    Polls a batch job until it stops making progress.
+    """
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        progress = ""
+        if batch.request_counts:
+            counts = batch.request_counts
+            progress = f" ({counts.completed + counts.failed}/{counts.total})"
+        print(f"Batch {batch.id}: {batch.status}{progress}")
+        if batch.status in FINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def get_batch_results(
+    client: OpenAI, batch: Batch
+) -> tuple[dict[str, list[tuple[str, str]]], dict[str, str]]:
+    """
+    Downloads the results of a batch job.
+
+    Returns the affiliations extracted for each paper DOI, and the papers whose
+    request failed with the reason.
+    """
+    results: dict[str, list[tuple[str, str]]] = {}
+    failures: dict[str, str] = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id is None:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            doi = entry["custom_id"]
+            response: Optional[dict[str, Any]] = entry.get("response")
+            if entry.get("error") or not response or response["status_code"] != 200:
+                failures[doi] = str(entry.get("error") or (response or {}).get("body"))
+                continue
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[doi] = parse_affiliations(str(content))
+            except Exception as e:
+                failures[doi] = f"Could not parse answer: {e!r}"
+    return results, failures
+
+
+def delete_batch_files(client: OpenAI, batch: Batch) -> None:
+    for file_id in (batch.input_file_id, batch.output_file_id, batch.error_file_id):
+        if file_id is not None:
+            client.files.delete(file_id)
+
+
+def create_client(base_url: Optional[str]) -> OpenAI:
+    """
+    Creates the client for the given OpenAI-compatible API, or for the default one.
+    Local APIs are usually not protected, so they do not need OPENAI_API_KEY.
+    """
+    if base_url is None:
+        return get_default_client()
+    return OpenAI(base_url=base_url, api_key=os.getenv("OPENAI_API_KEY") or "unused")
+
+
+# Like fill_affiliations.py, this prints a lot, in case something goes wrong.
+def main(args: argparse.Namespace, client: Optional[OpenAI] = None) -> None:
+    client = client or create_client(args.base_url)
+    errors: list[str] = []
+    # No connection is held while waiting for the batch, which may take hours.
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        todo = get_papers_to_process(
+            connection, cursor, args.conference, args.year, args.workers
+        )
+        authors_by_doi = dict(todo)
+
+        # PDFs already processed with the same model and prompt are left out of the batch.
+        digests = get_pdf_digests(args.pdf_directory, list(authors_by_doi), errors)
+        cached = get_cached_affiliations(cursor, list(digests.values()))
+    results = {doi: cached[d] for doi, d in digests.items() if d in cached}
+    print(f"Found {len(results)} papers in the cache.")
+    batch_results: dict[str, list[tuple[str, str]]] = {}
+    failures: dict[str, str] = {}
+
+    batch_id: Optional[str] = args.batch_id
+    if batch_id is None:
+        requests = []
+        for doi in [doi for doi in digests if doi not in results]:
+            try:
+                pdf_path = get_pdf_path(args.pdf_directory, doi)
+                requests.append(build_batch_request(doi, pdf_path))
+            except Exception as e:
+                print(f"[ERROR] Could not read the PDF of {doi}.")
+                errors.append(f"{doi} / {str(e)}")
+                del digests[doi]
+        if requests:
+            batch = submit_batch(client, requests, f"{args.conference} {args.year}")
+            batch_id = batch.id
+            print(f"Submitted batch {batch_id} with {len(requests)} papers.")
+            print(f"If interrupted, resume with --batch-id {batch_id}.")
+
+    if batch_id is not None:
+        batch = wait_for_batch(client, batch_id, args.poll_interval)
+        if batch.status != "completed":
+            print(
+                f"[ERROR] Batch {batch_id} {batch.status}, ingesting partial results."
+            )
+        batch_results, failures = get_batch_results(client, batch)
+        results.update(batch_results)
+
+    def ingest(connection: psycopg2.extensions.connection) -> list[str]:
+        cursor = connection.cursor()
+        store_affiliations(
+            cursor,
+            {
+                digests[doi]: affiliations
+                for doi, affiliations in batch_results.items()
+                if doi in digests
+            },
+        )
+        ingest_errors: list[str] = []
+        affiliation_index = load_affiliation_index(cursor)
+        for doi, affiliations in results.items():
+            if doi not in authors_by_doi:
+                print(f"Paper {doi} already has affiliations in database. Skipping.")
+                continue
+            print_paper(doi, authors_by_doi[doi])
+            save_paper_affiliations(
+                cursor,
+                doi,
+                authors_by_doi[doi],
+                affiliations,
+                affiliation_index,
+                ingest_errors,
+                digests.get(doi),
+            )
+        # The export reads the submissions from this view.
+        refresh_export_view(cursor)
+        return ingest_errors
+
+    errors += run_with_retry(ingest)
+    if batch_id is not None and batch.status == "completed":
+        delete_batch_files(client, batch)
+    for doi, reason in failures.items():
+        print(f"[ERROR] Batch request failed for {doi}.")
+        errors.append(f"{doi} / {reason}")
+    for doi in digests.keys() - results.keys() - failures.keys():
+        errors.append(f"{doi} / No result in batch {batch_id}")
+
+    print("\n\n")
+    print("LIST OF ERRORS, PLEASE ADD MANUALLY:")
+    for error in errors:
+        print(error)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract the affiliations of a conference's papers with a single OpenAI batch job"
+    )
+    parser.add_argument("--conference", type=str, required=True)
+    parser.add_argument("--year", type=int, required=True)
+    parser.add_argument("--pdf-directory", type=str, required=True)
+    parser.add_argument(
+        "--batch-id", type=str, help="Resume waiting for and ingesting this batch"
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between batch status checks",
+    )
+    parser.add_argument(
+        "--base-url",
+        type=str,
+        help="OpenAI-compatible API to use instead of OPENAI_BASE_URL or the default",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of concurrent dblp requests for missing author lists",
+    )
+    main(parser.parse_args())
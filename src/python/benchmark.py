@@ -0,0 +1,433 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, NamedTuple, TypedDict
+
+import numpy as np
+import numpy.typing as npt
+
+from db_to_json import (
+    HappeningRow,
+    SubmissionRow,
+    StreamedConference,
+    _no_suggestions,
+    build_conference,
+    write_output,
+    write_streamed_output,
+)
+from find_nearest_city import DEFAULT_MIN_POPULATION, CityIndex, CityTable
+from geometric_median import (
+    calculate_geometric_medians,
+    calculate_spherical_geometric_medians,
+)
+from match_authors import match_authors
+
+# Bump whenever the generated data or what is timed changes, as reports of different
+# versions cannot be compared.
+REPORT_VERSION = 1
+DEFAULT_SEED = 0
+DEFAULT_REPEATS = 5
+COMPONENTS = [
+    "spherical_median",
+    "planar_median",
+    "city_index_build",
+    "nearest_city",
+    "city_ranking",
+    "author_matching",
+    "json_export",
+    "json_stream_export",
+]
+# Components this much slower than in the baseline are reported as regressions.
+DEFAULT_MAX_SLOWDOWN = 1.25
+
+SYLLABLES = ["an", "bel", "cor", "da", "el", "fan", "gu", "hi", "jo", "ka", "li"]
+SYLLABLES += ["mar", "no", "os", "pe", "qui", "ro", "sa", "tan", "ul", "ve", "zhu"]
+# Some first names need transliterating before being compared.
+ACCENTED_FIRST_NAMES = ["José", "Zoë", "Łukasz", "Søren", "Çelik", "Ana-María"]
+
+
+class Scale(NamedTuple):
+    happenings: int
+    # Authors of accepted papers per happening.
+    authors: int
+    affiliations: int
+    # Metropolitan areas the affiliations are grouped around.
+    clusters: int
+    # Candidate cities, about half of them above the population threshold.
+    cities: int
+
+
+SCALES = {
+    "small": Scale(
+        happenings=5, authors=200, affiliations=100, clusters=5, cities=1_000
+    ),
+    "medium": Scale(
+        happenings=5, authors=2_000, affiliations=1_000, clusters=20, cities=10_000
+    ),
+    "large": Scale(
+        happenings=5, authors=20_000, affiliations=5_000, clusters=50, cities=40_000
+    ),
+}
+
+
+class SyntheticConference(NamedTuple):
+    name: str
+    happenings: list[HappeningRow]
+    submissions: dict[tuple[str, int], list[SubmissionRow]]
+    # dblp author list of each paper, and the names as extracted from its PDF.
+    papers: list[tuple[list[str], list[str]]]
+    cities: CityTable
+
+
+class Timing(TypedDict):
+    min: float
+    median: float
+    repeats: int
+
+
+def _name(rng: np.random.Generator, syllables: int) -> str:
+    return "".join(rng.choice(SYLLABLES, size=syllables)).capitalize()
+
+
+def _extracted_name(rng: np.random.Generator, author: str) -> str:
+    # PDFs spell names differently than dblp: initials, family name first, case.
+    first, last = author.split(" ", 1)
+    variant = rng.integers(4)
+    if variant == 0:
+        return f"{first[0]}. {last}"
+    if variant == 1:
+        return f"{last}, {first}"
+    if variant == 2:
+        return author.upper()
+    return author
+
+
+def generate_conference(
+    scale: Scale, seed: int = DEFAULT_SEED, name: str = "SYN"
+) -> SyntheticConference:
+    """
+    Generates a conference whose authors are spread like real ones: affiliations are
+    grouped around a few metropolitan areas, some of them across the antimeridian,
+    and a few large affiliations account for most authors.
+
+    The same scale and seed always give the same conference.
+    """
+    rng = np.random.default_rng(seed)
+
+    centers = np.column_stack(
+        [rng.uniform(-45, 65, scale.clusters), rng.uniform(-180, 180, scale.clusters)]
+    )
+    # Cluster and affiliation sizes follow a power law.
+    cluster_weights = 1 / np.arange(1, scale.clusters + 1)
+    affiliation_clusters = rng.choice(
+        scale.clusters,
+        size=scale.affiliations,
+        p=cluster_weights / cluster_weights.sum(),
+    )
+    latitudes = np.clip(
+        centers[affiliation_clusters, 0] + rng.normal(0, 1.5, scale.affiliations),
+        -89.0,
+        89.0,
+    )
+    longitudes = (
+        centers[affiliation_clusters, 1] + rng.normal(0, 1.5, scale.affiliations) + 180
+    ) % 360 - 180
+    # Numbered so that no two affiliations share a name.
+    affiliations = [
+        f"University of {_name(rng, 3)} {i}, {_name(rng, 2)} City, Country {cluster}"
+        for i, cluster in enumerate(affiliation_clusters)
+    ]
+    affiliation_weights = 1 / np.arange(1, scale.affiliations + 1) ** 0.8
+    affiliation_weights /= affiliation_weights.sum()
+
+    # Some authors come back, with the same affiliation, from one year to the next.
+    author_pool = [
+        f"{rng.choice(ACCENTED_FIRST_NAMES) if rng.random() < 0.05 else _name(rng, 2)} "
+        f"{_name(rng, 3)}"
+        for _ in range(scale.authors * 2)
+    ]
+    author_affiliations = rng.choice(
+        scale.affiliations, size=len(author_pool), p=affiliation_weights
+    )
+
+    happenings: list[HappeningRow] = []
+    submissions: dict[tuple[str, int], list[SubmissionRow]] = {}
+    papers: list[tuple[list[str], list[str]]] = []
+    for i in range(scale.happenings):
+        year = 2025 - i
+        host = int(rng.integers(scale.clusters))
+        happenings.append(
+            (
+                name,
+                year,
+                f"Host {host}",
+                float(centers[host, 0]),
+                float(centers[host, 1]),
+            )
+        )
+        authors = rng.choice(len(author_pool), size=scale.authors, replace=False)
+        submissions[(name, year)] = [
+            (
+                author_pool[a],
+                affiliations[author_affiliations[a]],
+                float(latitudes[author_affiliations[a]]),
+                float(longitudes[author_affiliations[a]]),
+            )
+            for a in authors
+        ]
+        start = 0
+        while start < len(authors):
+            size = int(rng.integers(1, 9))
+            paper = [author_pool[a] for a in authors[start : start + size]]
+            extracted = [_extracted_name(rng, author) for author in paper]
+            rng.shuffle(extracted)
+            papers.append((paper, extracted))
+            start += size
+
+    return SyntheticConference(
+        name, happenings, submissions, papers, generate_cities(scale.cities, rng)
+    )
+
+
+def generate_cities(count: int, rng: np.random.Generator) -> CityTable:
+    return CityTable(
+        np.array([f"City {i}" for i in range(count)], dtype=np.str_),
+        np.array(["Country"] * count, dtype=np.str_),
+        rng.uniform(-60, 75, count),
+        rng.uniform(-180, 180, count),
+        # The median population is about the threshold.
+        np.round(rng.lognormal(np.log(DEFAULT_MIN_POPULATION), 1.5, count)),
+    )
+
+
+def _author_locations(
+    conference: SyntheticConference,
+) -> tuple[list[npt.NDArray[np.float64]], list[npt.NDArray[np.float64]]]:
+    # One set for the whole conference, then one per happening, as in the export.
+    sets = [
+        Counter(
+            (lat, lon)
+            for rows in conference.submissions.values()
+            for *_, lat, lon in rows
+        )
+    ]
+    sets += [
+        Counter((lat, lon) for *_, lat, lon in rows)
+        for rows in conference.submissions.values()
+    ]
+    return (
+        [np.array(list(counts.keys())) for counts in sets],
+        [np.array(list(counts.values()), dtype=np.float64) for counts in sets],
+    )
+
+
+def _export(
+    conference: SyntheticConference, directory: str, stream: bool
+) -> Callable[[], None]:
+    path = os.path.join(directory, f"{conference.name}.json")
+
+    def build_and_write() -> None:
+        output_data, _ = build_conference(
+            conference.name, conference.happenings, conference.submissions
+        )
+        write_output(path, output_data)
+
+    def stream_and_write() -> None:
+        streamed = StreamedConference(conference.name)
+        for happening in conference.happenings:
+            rows = conference.submissions[(conference.name, happening[1])]
+            streamed.write_happening(
+                happening, ((conference.name, happening[1], *row) for row in rows)
+            )
+        # The same placeholders as build_conference writes.
+        suggestions = _no_suggestions(len(conference.happenings))
+        try:
+            write_streamed_output(path, streamed.chunks(suggestions))
+        finally:
+            streamed.submissions.close()
+
+    return stream_and_write if stream else build_and_write
+
+
+def benchmarks(
+    conference: SyntheticConference, directory: str
+) -> dict[str, Callable[[], Any]]:
+    """
+    Returns the timed components, by name, each set up to run on the conference.
+    Exports write their files to directory.
+    """
+    coord_sets, weight_sets = _author_locations(conference)
+    city_index = CityIndex(conference.cities, DEFAULT_MIN_POPULATION)
+    affiliation_coords = list(
+        {(row[2], row[3]) for rows in conference.submissions.values() for row in rows}
+    )
+    return {
+        "spherical_median": lambda: calculate_spherical_geometric_medians(
+            coord_sets, weight_sets
+        ),
+        "planar_median": lambda: calculate_geometric_medians(coord_sets, weight_sets),
+        "city_index_build": lambda: CityIndex(
+            conference.cities, DEFAULT_MIN_POPULATION
+        ),
+        "nearest_city": lambda: city_index.nearest(affiliation_coords),
+        "city_ranking": lambda: city_index.rank(coord_sets, weight_sets, 10),
+        "author_matching": lambda: [
+            match_authors(authors, extracted)
+            for authors, extracted in conference.papers
+        ],
+        "json_export": _export(conference, directory, stream=False),
+        "json_stream_export": _export(conference, directory, stream=True),
+    }
+
+
+def time_component(function: Callable[[], Any], repeats: int) -> Timing:
+    """
+    Times a function over repeats runs, after a first one to warm up caches.
+    """
+    function()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return {
+        "min": min(durations),
+        "median": float(np.median(durations)),
+        "repeats": repeats,
+    }
+
+
+def run_benchmarks(
+    scales: list[str], components: list[str], repeats: int, seed: int
+) -> dict[str, Any]:
+    """
+    Runs the components at each scale.
+
+    Returns the report, with the timings in seconds of each component at each scale.
+    """
+    results: dict[str, dict[str, Timing]] = {}
+    with tempfile.TemporaryDirectory(prefix="benchmark") as directory:
+        for scale_name in scales:
+            conference = generate_conference(SCALES[scale_name], seed)
+            timed = benchmarks(conference, directory)
+            results[scale_name] = {}
+            for component in components:
+                timing = time_component(timed[component], repeats)
+                results[scale_name][component] = timing
+                print(
+                    f"{scale_name:8} {component:20} {timing['min'] * 1000:10.2f} ms "
+                    f"(median {timing['median'] * 1000:.2f} ms)"
+                )
+    return {
+        "report_version": REPORT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "seed": seed,
+        "scales": {name: SCALES[name]._asdict() for name in scales},
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare_reports(
+    report: dict[str, Any], baseline: dict[str, Any], max_slowdown: float
+) -> list[str]:
+    """
+    Compares the fastest run of each component with the baseline's.
+
+    Returns the components slower than max_slowdown times the baseline.
+    """
+    if (report["report_version"], report["seed"]) != (
+        baseline.get("report_version"),
+        baseline.get("seed"),
+    ):
+        raise ValueError("The baseline was generated from different data")
+
+    regressions = []
+    for scale_name, timings in report["results"].items():
+        if baseline["scales"].get(scale_name) != report["scales"][scale_name]:
+            print(f"{scale_name:8} not in the baseline, or at a different size.")
+            continue
+        for component, timing in timings.items():
+            previous = baseline["results"][scale_name].get(component)
+            if previous is None:
+                print(f"{scale_name:8} {component:20} not in the baseline.")
+                continue
+            ratio = timing["min"] / previous["min"]
+            print(
+                f"{scale_name:8} {component:20} {previous['min'] * 1000:10.2f} ms -> "
+                f"{timing['min'] * 1000:10.2f} ms ({ratio:.2f}x)"
+            )
+            if ratio > max_slowdown:
+                regressions.append(f"{scale_name} {component}: {ratio:.2f}x slower")
+    return regressions
+
+
+def main(args: argparse.Namespace) -> None:
+    report = run_benchmarks(args.scales, args.components, args.repeats, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Report written to {args.output}")
+    if not args.baseline:
+        return
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    print(f"\nCompared to {args.baseline} ({baseline.get('created_at')}):")
+    regressions = compare_reports(report, baseline, args.max_slowdown)
+    for regression in regressions:
+        print(f"[ERROR] {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Time the compute paths of the ingestion and export on synthetic "
+            "conferences, optionally comparing with a baseline report"
+        )
+    )
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        choices=list(SCALES),
+        default=["small", "medium"],
+        help="Conference sizes to run at",
+    )
+    parser.add_argument(
+        "--components",
+        nargs="+",
+        choices=COMPONENTS,
+        default=COMPONENTS,
+        help="Components to time",
+    )
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument(
+        "--seed", type=int, default=DEFAULT_SEED, help="Seed of the synthetic data"
+    )
+    parser.add_argument("--output", type=str, help="Write the JSON report to this path")
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        help="Report to compare with, exiting with an error on regressions",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=DEFAULT_MAX_SLOWDOWN,
+        help="Slowdown relative to the baseline above which a component regressed",
+    )
+    main(parser.parse_args())
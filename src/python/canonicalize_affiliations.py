@@ -0,0 +1,368 @@
+import argparse
+import math
+import re
+from collections import Counter
+from typing import Callable, Optional
+
+import psycopg2
+from unidecode import unidecode
+
+from database_connection import get_connection
+from migrate import refresh_export_view
+
+# Minimum Jaccard similarity between the character trigrams of two institution names
+# for them to be considered the same institution.
+DEFAULT_THRESHOLD = 0.8
+# Duplicates are only merged if their geocoded locations are this close.
+MAX_MERGE_DISTANCE_KM = 50.0
+
+ABBREVIATIONS = {
+    "univ": "university",
+    "uni": "university",
+    "inst": "institute",
+    "tech": "technology",
+    "technol": "technology",
+    "natl": "national",
+    "dept": "department",
+    "st": "saint",
+}
+# Left out of names and acronyms, so "Institute of Technology" becomes "IT".
+STOP_WORDS = {"the", "of", "and", "for", "at", "in", "de", "la", "le", "des", "du"}
+# Words starting or ending a part of an affiliation that is a unit inside the
+# institution, like "School of Computer Science" or "Computer Science Department".
+SUBUNIT_WORDS = {"department", "faculty", "division", "group", "lab", "laboratory"}
+SUBUNIT_WORDS |= {"school", "college", "center", "centre", "chair", "unit", "team"}
+# Prefixes of the words naming an institution, in any of the usual languages.
+INSTITUTION_PREFIXES = (
+    "univ",
+    "institut",
+    "college",
+    "school",
+    "academ",
+    "polytechn",
+    "politecn",
+    "hochschule",
+    "ecole",
+)
+
+
+def normalize_tokens(text: str) -> list[str]:
+    """
+    Lowercases, transliterates and splits text into words, expanding abbreviations.
+    """
+    text = unidecode(text).lower().replace("&", " and ")
+    words = re.findall(r"[a-z0-9]+", text)
+    return [ABBREVIATIONS.get(word, word) for word in words]
+
+
+def _is_subunit(part: list[str]) -> bool:
+    return part[0] in SUBUNIT_WORDS or part[-1] in SUBUNIT_WORDS
+
+
+def _institution_part(parts: list[list[str]]) -> int:
+    named = [
+        i
+        for i, part in enumerate(parts)
+        if any(word.startswith(INSTITUTION_PREFIXES) for word in part)
+    ]
+    # A school or college is only the institution if no later part names another
+    # one, so "College of Computing, Georgia Institute of Technology" is the latter
+    # and "University of Maryland, College Park" the former.
+    for i in named:
+        if not _is_subunit(parts[i]) or i == named[-1]:
+            return i
+    # Without an institution word, like "Microsoft Research", the first part that is
+    # not a subunit is the institution.
+    i = 0
+    while i < len(parts) - 1 and _is_subunit(parts[i]):
+        i += 1
+    return i
+
+
+def split_affiliation(affiliation: str) -> tuple[list[str], str]:
+    """
+    Splits an affiliation string into the words naming the institution and the
+    normalized name of its city.
+
+    Affiliations look like "Department, Institution, City, Country". The institution
+    is the part naming a university, institute or the like, leaving out departments
+    and other subunits before it, and the next part is the city. Countries are left
+    out, as they are shared by too many institutions to tell them apart.
+    """
+    parts = [normalize_tokens(part) for part in affiliation.split(",")]
+    parts = [part for part in parts if part]
+    if not parts:
+        return [], ""
+    i = _institution_part(parts)
+    institution = [word for word in parts[i] if word not in STOP_WORDS]
+    location = " ".join(parts[i + 1]) if i + 1 < len(parts) else ""
+    return institution, location
+
+
+def acronym(words: list[str]) -> Optional[str]:
+    if len(words) < 2:
+        return None
+    return "".join(word[0] for word in words)
+
+
+def trigrams(words: list[str]) -> set[str]:
+    text = f" {' '.join(words)} "
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class AffiliationIndex:
+    """
+    Index of canonical affiliation names, used to map near-identical affiliation
+    strings onto an existing one.
+
+    Institutions are indexed by the character trigrams of their normalized name and by
+    their acronym, so that a lookup only compares against the few canonical names
+    sharing trigrams with it instead of every affiliation.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD) -> None:
+        self.threshold = threshold
+        self.names: list[str] = []
+        self.locations: list[str] = []
+        self.trigram_sets: list[set[str]] = []
+        self.by_exact: dict[str, int] = {}
+        self.by_trigram: dict[str, list[int]] = {}
+        self.by_acronym: dict[str, list[int]] = {}
+        self.by_institution: dict[str, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str) -> None:
+        """
+        Adds a canonical affiliation name to the index.
+        """
+        if name in self.by_exact:
+            return
+        institution, location = split_affiliation(name)
+        index = len(self.names)
+        self.names.append(name)
+        self.locations.append(location)
+        self.trigram_sets.append(trigrams(institution))
+        self.by_exact[name] = index
+        for trigram in self.trigram_sets[index]:
+            self.by_trigram.setdefault(trigram, []).append(index)
+        short = acronym(institution)
+        if short:
+            self.by_acronym.setdefault(short, []).append(index)
+        self.by_institution.setdefault(" ".join(institution), []).append(index)
+
+    def _compatible_location(self, index: int, location: str) -> bool:
+        # Without a location on either side, the institution name has to do.
+        return (
+            not location
+            or not self.locations[index]
+            or location == self.locations[index]
+        )
+
+    def match(self, name: str) -> Optional[str]:
+        """
+        Finds the canonical name of an affiliation.
+
+        Returns the indexed name for the same institution at a compatible location, or
+        None if there is none.
+        """
+        if name in self.by_exact:
+            return name
+        institution, location = split_affiliation(name)
+        if not institution:
+            return None
+
+        # An acronym on one side matching the full name on the other, like
+        # "MIT" and "Massachusetts Institute of Technology".
+        candidates: list[int] = []
+        if len(institution) == 1:
+            candidates += self.by_acronym.get(institution[0], [])
+        short = acronym(institution)
+        if short:
+            candidates += self.by_institution.get(short, [])
+        for index in candidates:
+            if self._compatible_location(index, location):
+                return self.names[index]
+
+        own_trigrams = trigrams(institution)
+        shared: Counter[int] = Counter()
+        for trigram in own_trigrams:
+            shared.update(self.by_trigram.get(trigram, []))
+        best: Optional[int] = None
+        best_similarity = self.threshold
+        for index, count in shared.items():
+            similarity = count / (
+                len(own_trigrams) + len(self.trigram_sets[index]) - count
+            )
+            if similarity >= best_similarity and self._compatible_location(
+                index, location
+            ):
+                best, best_similarity = index, similarity
+        return self.names[best] if best is not None else None
+
+
+def load_affiliation_index(
+    cursor: psycopg2.extensions.cursor, threshold: float = DEFAULT_THRESHOLD
+) -> AffiliationIndex:
+    """
+    Builds an index over every affiliation in the database.
+    """
+    cursor.execute("SELECT affiliation_name FROM affiliations")
+    index = AffiliationIndex(threshold)
+    for (name,) in cursor.fetchall():
+        index.add(name)
+    return index
+
+
+def canonicalize(
+    index: AffiliationIndex,
+    affiliations: list[str],
+    locate: Callable[[list[str]], dict[str, Optional[tuple[float, float]]]],
+) -> dict[str, str]:
+    """
+    Maps affiliation strings to their canonical name, adding the ones without one to
+    the index as new canonical names.
+
+    A canonical name that differs from the affiliation is only used if locate, which
+    gives the coordinates of affiliations, puts both within MAX_MERGE_DISTANCE_KM of
+    each other. The affiliation is its own canonical name otherwise.
+    """
+    canonical: dict[str, str] = {}
+    for affiliation in affiliations:
+        match = index.match(affiliation)
+        if match is None:
+            index.add(affiliation)
+            match = affiliation
+        canonical[affiliation] = match
+
+    fuzzy = {
+        affiliation: match
+        for affiliation, match in canonical.items()
+        if match != affiliation
+    }
+    if not fuzzy:
+        return canonical
+    coords = locate([*fuzzy.keys(), *fuzzy.values()])
+    for affiliation, match in fuzzy.items():
+        own, other = coords.get(affiliation), coords.get(match)
+        if (
+            own is None
+            or other is None
+            or _distance_km(own, other) > MAX_MERGE_DISTANCE_KM
+        ):
+            index.add(affiliation)
+            canonical[affiliation] = affiliation
+    return canonical
+
+
+def _distance_km(a: tuple[float, float], b: tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+def find_duplicates(
+    cursor: psycopg2.extensions.cursor, threshold: float = DEFAULT_THRESHOLD
+) -> dict[str, list[str]]:
+    """
+    Groups the existing affiliations that name the same institution.
+
+    Manually edited and most referenced affiliations are preferred as canonical names.
+    Manually edited affiliations are never considered duplicates.
+
+    Returns the duplicates of each canonical name that has any.
+    """
+    cursor.execute("""
+        SELECT aff.affiliation_name, aff.latitude, aff.longitude, aff.manually_edited
+        FROM affiliations AS aff
+        LEFT JOIN paper_affiliations AS p_a ON p_a.affiliation_name = aff.affiliation_name
+        GROUP BY aff.affiliation_name
+        ORDER BY aff.manually_edited DESC, COUNT(p_a.paper_doi) DESC, aff.affiliation_name
+        """)
+    index = AffiliationIndex(threshold)
+    coords: dict[str, tuple[float, float]] = {}
+    duplicates: dict[str, list[str]] = {}
+    for name, latitude, longitude, manually_edited in cursor.fetchall():
+        if latitude is not None and longitude is not None:
+            coords[name] = (latitude, longitude)
+        match = None if manually_edited else index.match(name)
+        if (
+            match is not None
+            and name in coords
+            and match in coords
+            and _distance_km(coords[name], coords[match]) > MAX_MERGE_DISTANCE_KM
+        ):
+            match = None
+        if match is None:
+            index.add(name)
+        else:
+            duplicates.setdefault(match, []).append(name)
+    return duplicates
+
+
+def merge_duplicates(
+    cursor: psycopg2.extensions.cursor, duplicates: dict[str, list[str]]
+) -> None:
+    """
+    Points the authors of duplicate affiliations to the canonical one, then deletes
+    the duplicates.
+    """
+    pairs = [
+        (duplicate, canonical)
+        for canonical, names in duplicates.items()
+        for duplicate in names
+    ]
+    cursor.execute(
+        """
+        UPDATE paper_affiliations AS p_a
+        SET affiliation_name = merged.canonical
+        FROM unnest(%(duplicates)s::text[], %(canonicals)s::text[])
+            AS merged(duplicate, canonical)
+        WHERE p_a.affiliation_name = merged.duplicate
+        """,
+        {
+            "duplicates": [duplicate for duplicate, _ in pairs],
+            "canonicals": [canonical for _, canonical in pairs],
+        },
+    )
+    print(f"Updated {cursor.rowcount} author affiliations.")
+    cursor.execute(
+        "DELETE FROM affiliations WHERE affiliation_name = ANY(%s)",
+        ([duplicate for duplicate, _ in pairs],),
+    )
+    print(f"Deleted {cursor.rowcount} duplicate affiliations.")
+
+
+def main(args: argparse.Namespace) -> None:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        duplicates = find_duplicates(cursor, args.threshold)
+        for canonical, names in duplicates.items():
+            print(canonical)
+            for name in names:
+                print(f"  <- {name}")
+        print(
+            f"Found {sum(len(names) for names in duplicates.values())} duplicates "
+            f"of {len(duplicates)} affiliations."
+        )
+        if args.apply:
+            merge_duplicates(cursor, duplicates)
+            refresh_export_view(cursor)
+            conn.commit()
+        else:
+            print("Dry run, pass --apply to merge them.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find and merge affiliations that name the same institution"
+    )
+    parser.add_argument(
+        "--apply", action="store_true", help="Merge the duplicates that were found"
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    main(parser.parse_args())
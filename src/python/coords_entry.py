@@ -1,35 +1,69 @@
 import sys
 
 import psycopg2
+from psycopg2.extras import execute_values
 
-from get_coords_from_affiliation import get_coords_from_affiliation
-from database_connection import open_connection
+from geocoding_cache import resolve_affiliations
+from database_connection import get_connection
 
 
-def insert_affiliation(cursor: psycopg2.extensions.cursor, affiliation: str) -> None:
+def insert_affiliations(
+    cursor: psycopg2.extensions.cursor, affiliations: list[str]
+) -> dict[str, str]:
     """
-    Insert a new affiliation into the database if not present.
+    Insert new affiliations into the database if not present.
+
+    Existing and cached affiliations are resolved in a single query, the others are
+    geocoded, and all the new ones are inserted in a single statement.
 
     Args:
         cursor: The database cursor.
-        affiliation: The affiliation to handle.
+        affiliations: The affiliations to handle.
+    Returns:
+        The affiliations that could not be geocoded, with the reason.
     """
-    cursor.execute(
-        "SELECT COUNT(*) FROM affiliations WHERE affiliation_name = %s",
-        (affiliation,),
-    )
-    result = cursor.fetchone()
-    if result and result[0]:
-        return
+    resolved, failures = resolve_affiliations(cursor, affiliations)
 
-    coords = get_coords_from_affiliation(affiliation)
+    rows: list[tuple[str, float, float]] = []
+    for affiliation, resolution in resolved.items():
+        if resolution["known"]:
+            continue
+        if resolution["coords"] is None:
+            failures[affiliation] = (
+                f"Location not found: {affiliation} (according to {resolution['source']})"
+            )
+            continue
+        rows.append((affiliation, *resolution["coords"]))
 
     # If the affiliation does not exist, insert it with the new coordinates
-    cursor.execute(
-        "INSERT INTO affiliations (affiliation_name, latitude, longitude, manually_edited) VALUES (%s, %s, %s, FALSE)",
-        (affiliation, coords[0], coords[1]),
+    execute_values(
+        cursor,
+        """
+        INSERT INTO affiliations (affiliation_name, latitude, longitude, manually_edited)
+        VALUES %s
+        ON CONFLICT (affiliation_name) DO NOTHING
+        """,
+        rows,
+        template="(%s, %s, %s, FALSE)",
     )
-    print(f"Inserted new affiliation: {affiliation} with coordinates {coords}.")
+    for affiliation, latitude, longitude in rows:
+        print(
+            f"Inserted new affiliation: {affiliation} with coordinates {(latitude, longitude)}."
+        )
+    return failures
+
+
+def insert_affiliation(cursor: psycopg2.extensions.cursor, affiliation: str) -> None:
+    """
+    Insert a new affiliation into the database if not present.
+
+    Args:
+        cursor: The database cursor.
+        affiliation: The affiliation to handle.
+    """
+    failures = insert_affiliations(cursor, [affiliation])
+    if affiliation in failures:
+        raise Exception(failures[affiliation])
 
 
 def main() -> None:
@@ -37,12 +71,9 @@ def main() -> None:
         print("Usage: python coords_entry.py <affiliation>")
         sys.exit(1)
 
-    conn = open_connection()
-    cursor = conn.cursor()
-    insert_affiliation(cursor, sys.argv[1])
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        insert_affiliation(cursor, sys.argv[1])
 
 
 if __name__ == "__main__":
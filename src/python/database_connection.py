@@ -1,13 +1,159 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TypeVar
 
 import psycopg2
+import psycopg2.errors
+import psycopg2.pool
 
+T = TypeVar("T")
 
-def open_connection() -> psycopg2.extensions.connection:
-    return psycopg2.connect(
-        database=os.getenv("DATABASE_NAME"),
-        host=os.getenv("DATABASE_HOST"),
-        user=os.getenv("DATABASE_USER"),
-        password=os.getenv("DATABASE_PASSWORD"),
-        port=int(os.getenv("DATABASE_PORT", "5432")),
+# All of these can be overridden with the environment variable of the same name.
+# Connections kept open by each process.
+DATABASE_POOL_SIZE = 4
+# Seconds to wait for a connection to be established.
+DATABASE_CONNECT_TIMEOUT = 10
+# Milliseconds after which a statement is cancelled, 0 to wait forever.
+DATABASE_STATEMENT_TIMEOUT = 600_000
+# Attempts at connecting, or at running an operation hitting a transient error.
+DATABASE_RETRIES = 3
+
+# Seconds before the first retry, doubled for each next one.
+RETRY_BACKOFF = 1.0
+# Errors after which running the same transaction again may succeed. Cancelled
+# statements are left out, as they would most likely time out again.
+TRANSIENT_ERRORS = (
+    psycopg2.errors.SerializationFailure,
+    psycopg2.errors.DeadlockDetected,
+    psycopg2.errors.AdminShutdown,
+    psycopg2.InterfaceError,
+)
+
+
+def _setting(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, psycopg2.errors.QueryCanceled):
+        return False
+    # Connection failures and losses have no more specific type.
+    return isinstance(error, TRANSIENT_ERRORS) or (
+        type(error) is psycopg2.OperationalError
     )
+
+
+def _retrying(operation: Callable[[], T]) -> T:
+    retries = _setting("DATABASE_RETRIES", DATABASE_RETRIES)
+    for attempt in range(retries):
+        try:
+            return operation()
+        except Exception as e:
+            if not _is_transient(e) or attempt == retries - 1:
+                raise
+            delay = RETRY_BACKOFF * 2**attempt
+            print(f"[WARNING] Database error, retrying in {delay}s: {e}")
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def connection_parameters() -> dict[str, Any]:
+    statement_timeout = _setting(
+        "DATABASE_STATEMENT_TIMEOUT", DATABASE_STATEMENT_TIMEOUT
+    )
+    return {
+        "database": os.getenv("DATABASE_NAME"),
+        "host": os.getenv("DATABASE_HOST"),
+        "user": os.getenv("DATABASE_USER"),
+        "password": os.getenv("DATABASE_PASSWORD"),
+        "port": int(os.getenv("DATABASE_PORT", "5432")),
+        "connect_timeout": _setting(
+            "DATABASE_CONNECT_TIMEOUT", DATABASE_CONNECT_TIMEOUT
+        ),
+        "options": f"-c statement_timeout={statement_timeout}",
+        # Detect dead connections, and keep idle ones from being dropped by NATs.
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 5,
+    }
+
+
+def open_connection() -> psycopg2.extensions.connection:
+    """
+    Opens a new connection, retrying transient failures. Prefer get_connection, which
+    reuses the connections of a pool.
+    """
+
+    def connect() -> psycopg2.extensions.connection:
+        conn: psycopg2.extensions.connection = psycopg2.connect(
+            **connection_parameters()
+        )
+        return conn
+
+    return _retrying(connect)
+
+
+class _Pool:
+    def __init__(self, size: int) -> None:
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            0, size, **connection_parameters()
+        )
+        # ThreadedConnectionPool raises when exhausted, wait for a connection instead.
+        self.slots = threading.BoundedSemaphore(size)
+
+
+_pool: Optional[_Pool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> _Pool:
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Connections cannot be shared with forked processes, such as the export
+        # workers, so each process gets its own pool. The parent's connections are
+        # left alone, closing them from the child would break them for the parent.
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = _Pool(_setting("DATABASE_POOL_SIZE", DATABASE_POOL_SIZE))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+@contextmanager
+def get_connection() -> Iterator[psycopg2.extensions.connection]:
+    """
+    Borrows a connection from the pool of the current process, waiting for one if all
+    of them are in use.
+
+    The transaction is committed when the block exits normally, and rolled back if it
+    raises. Connections that broke are closed instead of being given back to the pool.
+    """
+    pool = _get_pool()
+    with pool.slots:
+        conn = _retrying(pool.pool.getconn)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            pool.pool.putconn(conn, close=bool(conn.closed))
+
+
+def run_with_retry(operation: Callable[[psycopg2.extensions.connection], T]) -> T:
+    """
+    Runs an operation in a transaction of its own on a pooled connection, running it
+    again on a fresh transaction if it hits a transient error, like a lost connection
+    or a deadlock. The operation must be safe to run more than once.
+    """
+
+    def attempt() -> T:
+        with get_connection() as conn:
+            return operation(conn)
+
+    return _retrying(attempt)
@@ -1,133 +1,863 @@
+import argparse
+import gzip
 import json
 import os
-import psycopg2
-from database_connection import open_connection
-from find_nearest_city import find_nearest_city
-from geometric_median import calculate_geometric_median_from_coords
+import sys
+import tempfile
+from array import array
+from collections import Counter, defaultdict
+from itertools import groupby
+from typing import Any, Iterable, Iterator, NamedTuple, Optional, TypedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import brotli  # type: ignore
+import numpy as np
+import numpy.typing as npt
+from psycopg2.extensions import connection as Connection, cursor as Cursor
+from database_connection import get_connection, run_with_retry
+from find_nearest_city import get_city_index
+from geometric_median import calculate_spherical_geometric_medians
 
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "www", "data")
+# Fingerprints of the data each conference file was last generated from. Kept out of
+# OUTPUT_DIR, which is published as is.
+EXPORT_STATE_PATH = os.path.join(os.path.dirname(__file__), "export_state.json")
+# Bump whenever the output changes for the same data, to regenerate every file.
+EXPORT_VERSION = 5
 
+# Version of the file format, see www/data/db_to_jsonFORMAT.md.
+FORMAT_VERSION = 2
+# Affiliation coordinates are rounded to about a meter.
+COORDINATE_DECIMALS = 5
+# Number of cities listed by total travel distance in each file.
+CANDIDATE_CITIES = 10
+# Total travel distances are rounded to a tenth of a mile.
+DISTANCE_DECIMALS = 1
+# Number of happenings the rolling suggestion of each happening covers by default,
+# counting back from it.
+DEFAULT_WINDOW = 3
 
-def generate_json_for_frontend() -> None:
+# Rows fetched at a time by the server-side cursor of streaming exports.
+STREAM_CHUNK_SIZE = 10_000
+# Bytes copied at a time from the spooled happenings to the output files.
+STREAM_BUFFER_SIZE = 1 << 20
+
+# Only the most recent happenings of each conference are exported.
+HAPPENINGS_PER_CONFERENCE = 5
+
+RECENT_HAPPENINGS_SQL = """
+    SELECT conference_short_name, year, city, latitude, longitude
+    FROM (
+        SELECT
+            *,
+            ROW_NUMBER() OVER (
+                PARTITION BY conference_short_name ORDER BY year DESC
+            ) AS recency
+        FROM conference_happenings
+    ) AS ranked
+    WHERE recency <= %(limit)s
+"""
+
+# Hashes every row that ends up in a conference file. Happenings without any
+# submission still contribute their own row.
+FINGERPRINTS_SQL = f"""
+    WITH recent AS ({RECENT_HAPPENINGS_SQL})
+    SELECT
+        recent.conference_short_name,
+        md5(
+            string_agg(
+                concat_ws(
+                    '|',
+                    recent.year,
+                    recent.city,
+                    recent.latitude,
+                    recent.longitude,
+                    submissions.author_name,
+                    submissions.affiliation_name,
+                    submissions.latitude,
+                    submissions.longitude
+                ),
+                E'\\n'
+                ORDER BY
+                    recent.year,
+                    submissions.author_name,
+                    submissions.affiliation_name
+            )
+        )
+    FROM
+        recent
+    LEFT JOIN
+        happening_submissions AS submissions
+        ON submissions.conference_short_name = recent.conference_short_name
+        AND submissions.conference_year = recent.year
+    GROUP BY recent.conference_short_name;
+"""
+
+HappeningRow = tuple[str, int, str, Optional[float], Optional[float]]
+SubmissionRow = tuple[str, str, float, float]
+
+
+class SuggestionSettings(NamedTuple):
+    # Number of happenings, up to and including each one, that its rolling suggestion
+    # is computed over.
+    window: int = DEFAULT_WINDOW
+    # Weight of the authors of a happening relative to those of the next, more recent,
+    # one. 1 weighs every happening the same.
+    recency_decay: float = 1.0
+
+
+class AuthorLocations(NamedTuple):
+    # (affiliations, 2) latitudes and longitudes of a conference's affiliations.
+    coordinates: npt.NDArray[np.float64]
+    # (happenings, affiliations) number of authors at each affiliation per happening,
+    # most recent happening first.
+    happening_weights: npt.NDArray[np.float64]
+
+
+class Suggestions(TypedDict):
+    # Output fields of the conference, and of each of its happenings.
+    conference: dict[str, Any]
+    happenings: list[dict[str, Any]]
+
+
+# Conference short name, year, then a submission row.
+StreamedRow = tuple[str, int, str, str, float, float]
+
+
+def fetch_happenings(cur: Cursor) -> dict[str, list[HappeningRow]]:
     """
-    Generates a JSON file for each conference and saves it to src/www/data/
+    Fetches the recent happenings of every conference in one query.
+
+    Returns the happenings grouped by conference, most recent first.
+    """
+    cur.execute(
+        f"""
+        {RECENT_HAPPENINGS_SQL}
+        ORDER BY conference_short_name, year DESC;
+        """,
+        {"limit": HAPPENINGS_PER_CONFERENCE},
+    )
+    happenings: dict[str, list[HappeningRow]] = defaultdict(list)
+    for row in cur.fetchall():
+        happenings[row[0]].append(row)
+    return happenings
+
+
+def fetch_fingerprints(cur: Cursor) -> dict[str, str]:
+    """
+    Fetches a fingerprint of the exported data of every conference.
+
+    The hashing happens in the database, so only one short string per conference is
+    transferred to find out which conferences changed.
+    """
+    cur.execute(FINGERPRINTS_SQL, {"limit": HAPPENINGS_PER_CONFERENCE})
+    return {conf_name: fingerprint for conf_name, fingerprint in cur.fetchall()}
+
+
+def load_export_state(settings: SuggestionSettings) -> dict[str, str]:
+    """
+    Loads the fingerprints recorded by the previous export.
+
+    Returns an empty state when there is none, or when it was written by an export
+    with a different EXPORT_VERSION or different suggestion settings.
     """
-    conn = None
     try:
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        with open(EXPORT_STATE_PATH, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if state.get("version") != EXPORT_VERSION:
+        return {}
+    if state.get("settings") != settings._asdict():
+        return {}
+    return dict(state.get("fingerprints", {}))
 
-        conn = open_connection()
-        cur = conn.cursor()
 
-        # Get all distinct conference short names
-        cur.execute("SELECT conference_short_name FROM conference_happenings;")
-        conference_names = [row[0] for row in cur.fetchall()]
-        print(f"Found conferences: {conference_names}")
+def save_export_state(
+    fingerprints: dict[str, str], settings: SuggestionSettings
+) -> None:
+    """
+    Records the fingerprints of the exported conferences, leaving the file untouched
+    when they did not change.
+    """
+    content = json.dumps(
+        {
+            "version": EXPORT_VERSION,
+            "settings": settings._asdict(),
+            "fingerprints": fingerprints,
+        },
+        indent=4,
+        sort_keys=True,
+    )
+    try:
+        with open(EXPORT_STATE_PATH, "r") as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    tmp_path = f"{EXPORT_STATE_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, EXPORT_STATE_PATH)
+
 
-        # Loop through each conference
-        for conf_name in conference_names:
-            print(f"Conference: {conf_name}...")
+def fetch_submissions(
+    cur: Cursor, conferences: list[str]
+) -> dict[tuple[str, int], list[SubmissionRow]]:
+    """
+    Fetches the submissions of every recent happening of the given conferences in one
+    query.
 
-            output_data = {
-                "conference_short_name": conf_name,
-                "suggested_location": {
-                    "city": "Unknown",
-                    "latitude": None,
-                    "longitude": None,
-                },
-                "happenings": [],
+    Returns the submissions, with their affiliation coordinates, grouped by
+    (conference short name, year) and sorted by author and affiliation, so that the
+    output does not depend on the order the database returns rows in.
+    """
+    cur.execute(
+        f"""
+        WITH recent AS ({RECENT_HAPPENINGS_SQL})
+        SELECT
+            s.conference_short_name,
+            s.conference_year,
+            s.author_name,
+            s.affiliation_name,
+            s.latitude,
+            s.longitude
+        FROM
+            recent
+        JOIN
+            happening_submissions AS s
+            ON s.conference_short_name = recent.conference_short_name
+            AND s.conference_year = recent.year
+        WHERE
+            recent.conference_short_name = ANY(%(conferences)s)
+        ORDER BY
+            s.conference_short_name,
+            s.conference_year,
+            s.author_name COLLATE "C",
+            s.affiliation_name COLLATE "C";
+        """,
+        {"limit": HAPPENINGS_PER_CONFERENCE, "conferences": conferences},
+    )
+    submissions: dict[tuple[str, int], list[SubmissionRow]] = defaultdict(list)
+    for conf_name, year, author_name, aff_name, aff_lat, aff_lon in cur.fetchall():
+        submissions[(conf_name, year)].append((author_name, aff_name, aff_lat, aff_lon))
+    return submissions
+
+
+def build_conference(
+    conf_name: str,
+    happenings: list[HappeningRow],
+    submissions: dict[tuple[str, int], list[SubmissionRow]],
+) -> tuple[dict[str, Any], AuthorLocations]:
+    """
+    Builds the output data of a conference from its fetched rows.
+
+    Returns the output data, without suggested locations yet, along with where its
+    authors are.
+    """
+    # Affiliations are stored once in a columnar table and referenced by index.
+    affiliation_names: list[str] = []
+    affiliation_latitudes: list[float] = []
+    affiliation_longitudes: list[float] = []
+    affiliation_index: dict[str, int] = {}
+
+    output_data: dict[str, Any] = {
+        "format_version": FORMAT_VERSION,
+        "conference_short_name": conf_name,
+        **_no_suggestions(0)["conference"],
+        "affiliations": {
+            "name": affiliation_names,
+            "latitude": affiliation_latitudes,
+            "longitude": affiliation_longitudes,
+        },
+        "happenings": [],
+    }
+
+    # Authors sharing an affiliation are counted once per affiliation and passed to the
+    # medians as weights.
+    coordinates: list[tuple[float, float]] = []
+    happening_counts: list[Counter[int]] = []
+
+    for _, year, conf_city, conf_lat, conf_lon in happenings:
+        happening_submissions = submissions.get((conf_name, year), [])
+        counts: Counter[int] = Counter()
+        happening_counts.append(counts)
+
+        happening_data: dict[str, Any] = {
+            "year": year,
+            "location": {
+                "city": conf_city,
+                "latitude": conf_lat,
+                "longitude": conf_lon,
+            },
+            **_no_suggestions(1)["happenings"][0],
+            "submissions": [],
+        }
+        for author_name, aff_name, aff_lat, aff_lon in happening_submissions:
+            if aff_name not in affiliation_index:
+                affiliation_index[aff_name] = len(affiliation_names)
+                affiliation_names.append(aff_name)
+                affiliation_latitudes.append(round(aff_lat, COORDINATE_DECIMALS))
+                affiliation_longitudes.append(round(aff_lon, COORDINATE_DECIMALS))
+                coordinates.append((aff_lat, aff_lon))
+            counts[affiliation_index[aff_name]] += 1
+            happening_data["submissions"].append(
+                [author_name, affiliation_index[aff_name]]
+            )
+        output_data["happenings"].append(happening_data)
+
+    happening_weights = np.zeros((len(happening_counts), len(coordinates)))
+    for i, counts in enumerate(happening_counts):
+        happening_weights[i, list(counts.keys())] = list(counts.values())
+    return output_data, AuthorLocations(
+        np.array(coordinates, dtype=np.float64).reshape(-1, 2), happening_weights
+    )
+
+
+def write_output(path: str, output_data: dict[str, Any]) -> None:
+    """
+    Writes compact JSON to path, along with gzip and brotli compressed copies that the
+    web server can send as is to clients accepting them.
+    """
+    # Written like streamed output, so that both modes give the same bytes.
+    write_streamed_output(
+        path, [json.dumps(output_data, separators=(",", ":")).encode("utf-8")]
+    )
+
+
+def _unknown_location() -> dict[str, Any]:
+    return {"city": "Unknown", "latitude": None, "longitude": None}
+
+
+def _no_suggestions(happening_count: int) -> Suggestions:
+    return {
+        "conference": {
+            "suggested_location": _unknown_location(),
+            "candidate_cities": [],
+        },
+        "happenings": [
+            {
+                "suggested_location": _unknown_location(),
+                "window_suggested_location": _unknown_location(),
             }
+            for _ in range(happening_count)
+        ],
+    }
 
-            # Get all happenings for the conference
-            cur.execute(
-                """
-                SELECT year, city, latitude, longitude FROM conference_happenings
-                WHERE conference_short_name = %s
-                ORDER BY year DESC
-                LIMIT 5;
-            """,
-                (conf_name,),
+
+def suggest_locations(
+    conferences: list[str],
+    locations: list[AuthorLocations],
+    settings: SuggestionSettings,
+) -> dict[str, Suggestions]:
+    """
+    Suggests cities for the given conferences as a whole, for each of their happenings,
+    and for the rolling window of happenings ending at each one. Happenings are weighted
+    down by settings.recency_decay for each more recent happening in the conference and
+    window suggestions.
+
+    The author locations of all of them are gathered into coordinate sets and solved
+    together: every city is ranked by the total distance travelled to it for each
+    conference in one batched call, the medians of all the sets on the globe are solved
+    in another, starting from the cheapest city of their conference, and snapped to
+    their nearest cities in a single index query.
+
+    Returns the output fields of each conference and of its happenings.
+    """
+    suggestions = {
+        conf_name: _no_suggestions(len(conf_locations.happening_weights))
+        for conf_name, conf_locations in zip(conferences, locations)
+    }
+
+    # Each set is recorded along with its conference, its happening, or None for the
+    # conference as a whole, and the output field it is for.
+    coord_sets: list[npt.NDArray[np.float64]] = []
+    weight_sets: list[npt.NDArray[np.float64]] = []
+    owners: list[tuple[str, Optional[int], str]] = []
+    for conf_name, (coordinates, happening_weights) in zip(conferences, locations):
+        decay = settings.recency_decay ** np.arange(len(happening_weights))
+        sets: list[tuple[Optional[int], str, npt.NDArray[np.float64]]] = [
+            (None, "suggested_location", decay @ happening_weights)
+        ]
+        for i in range(len(happening_weights)):
+            window = happening_weights[i : i + settings.window]
+            sets.append((i, "suggested_location", happening_weights[i]))
+            sets.append((i, "window_suggested_location", decay[: len(window)] @ window))
+        for happening, field, weights in sets:
+            # Happenings without submissions keep an unknown location.
+            used = weights > 0
+            if used.any():
+                coord_sets.append(coordinates[used])
+                weight_sets.append(weights[used])
+                owners.append((conf_name, happening, field))
+
+    city_index = get_city_index()
+    conference_sets = [i for i, owner in enumerate(owners) if owner[1] is None]
+    rankings = dict(
+        zip(
+            [owners[i][0] for i in conference_sets],
+            city_index.rank(
+                [coord_sets[i] for i in conference_sets],
+                [weight_sets[i] for i in conference_sets],
+                CANDIDATE_CITIES,
+            ),
+        )
+    )
+    # The cheapest city is usually close to the median, and saves most iterations.
+    starts = [
+        (ranking[0]["latitude"], ranking[0]["longitude"]) if ranking else None
+        for ranking in (rankings.get(conf_name) for conf_name, _, _ in owners)
+    ]
+    medians = calculate_spherical_geometric_medians(coord_sets, weight_sets, starts)
+    for (conf_name, happening, _), median in zip(owners, medians):
+        if happening is None:
+            print(
+                f"Median for {conf_name}: {median['median']} "
+                f"({median['iterations']} iterations, converged: {median['converged']})"
             )
-            happenings = cur.fetchall()
-
-            all_coords = []
-
-            for year, conf_city, conf_lat, conf_lon in happenings:
-                # Get all submissions and their locations for the happening
-
-                cur.execute(
-                    """
-                    SELECT
-                        p_a.author_name,
-                        aff.affiliation_name,
-                        aff.latitude,
-                        aff.longitude
-                    FROM
-                        paper_affiliations AS p_a
-                    JOIN
-                        papers AS p ON p_a.paper_doi = p.doi
-                    JOIN
-                        affiliations AS aff ON p_a.affiliation_name = aff.affiliation_name
-                    WHERE
-                        p.conference_short_name = %s
-                        AND p.conference_year = %s
-                """,
-                    (conf_name, year),
-                )
-                all = cur.fetchall()
-
-                coords = [(sub[2], sub[3]) for sub in all]
-                all_coords.extend(coords)
-
-                submissions = []
-                for author_name, aff_name, aff_lat, aff_lon in all:
-                    submissions.append(
-                        {
-                            "author_name": author_name,
-                            "affiliation_name": aff_name,
-                            "location": {"latitude": aff_lat, "longitude": aff_lon},
-                        }
-                    )
-
-                # Create happening data here and append to output_data
-                happening_data = {
-                    "year": year,
-                    "location": {
-                        "city": conf_city,
-                        "latitude": conf_lat,
-                        "longitude": conf_lon,
-                    },
-                    "submissions": submissions,
-                }
-                output_data["happenings"].append(happening_data)
-
-            if all_coords:
-                median_coords_tuple, total_distance = (
-                    calculate_geometric_median_from_coords(all_coords)
+    nearest_cities = city_index.nearest([m["median"] for m in medians])
+
+    for conf_name, ranking in rankings.items():
+        suggestions[conf_name]["conference"]["candidate_cities"] = [
+            {
+                "city": city["city"],
+                "latitude": city["latitude"],
+                "longitude": city["longitude"],
+                "total_distance": round(city["total_distance"], DISTANCE_DECIMALS),
+            }
+            for city in ranking
+        ]
+    for (conf_name, happening, field), nearest in zip(owners, nearest_cities):
+        if not nearest:
+            continue
+        conf_suggestions = suggestions[conf_name]
+        fields = (
+            conf_suggestions["conference"]
+            if happening is None
+            else conf_suggestions["happenings"][happening]
+        )
+        fields[field] = {
+            "city": nearest[0]["city"],
+            "latitude": nearest[0]["latitude"],
+            "longitude": nearest[0]["longitude"],
+        }
+    return suggestions
+
+
+def export_conferences(
+    cur: Cursor,
+    happenings_by_conf: dict[str, list[HappeningRow]],
+    conferences: list[str],
+    settings: SuggestionSettings,
+) -> dict[str, str]:
+    """
+    Fetches, builds and writes the JSON files of the given conferences.
+
+    Their suggested locations are all computed together, see suggest_locations.
+
+    Returns the conferences that could not be exported, with the reason.
+    """
+    failures: dict[str, str] = {}
+    submissions = fetch_submissions(cur, conferences)
+
+    # Conferences are built first and their medians solved in one batch at the end.
+    pending: list[tuple[str, dict[str, Any], AuthorLocations]] = []
+    for conf_name in conferences:
+        print(f"Conference: {conf_name}...")
+        try:
+            pending.append(
+                (
+                    conf_name,
+                    *build_conference(
+                        conf_name, happenings_by_conf[conf_name], submissions
+                    ),
                 )
-                nearest_city_info = find_nearest_city(median_coords_tuple)
+            )
+        except Exception as e:
+            failures[conf_name] = f"Failed to build data: {e}"
+
+    suggestions = suggest_locations(
+        [conf_name for conf_name, _, _ in pending],
+        [locations for _, _, locations in pending],
+        settings,
+    )
+    for conf_name, output_data, _ in pending:
+        output_data.update(suggestions[conf_name]["conference"])
+        for happening_data, fields in zip(
+            output_data["happenings"], suggestions[conf_name]["happenings"]
+        ):
+            happening_data.update(fields)
+
+        # Write data to JSON file
+        output_f = os.path.join(OUTPUT_DIR, f"{conf_name}.json")
+        try:
+            write_output(output_f, output_data)
+        except OSError as e:
+            failures[conf_name] = f"Failed to write {output_f}: {e}"
+            continue
+        print(f"Data for {conf_name} written to {output_f}")
+
+    return failures
+
 
-            output_data["suggested_location"] = {
-                "city": nearest_city_info.get("city", "Unknown"),
-                "latitude": nearest_city_info.get("latitude", None),
-                "longitude": nearest_city_info.get("longitude", None),
+class StreamedConference:
+    """
+    Output of a conference being streamed from the database. Submissions are
+    serialized to a temporary file as they arrive, and only the affiliation table is
+    kept in memory, along with the author count of each affiliation per happening for
+    the medians.
+    """
+
+    def __init__(self, conf_name: str) -> None:
+        self.conf_name = conf_name
+        self.happenings: list[HappeningRow] = []
+        self.submissions = tempfile.TemporaryFile()
+        # Offset in submissions where the submissions of each happening end.
+        self.submission_ends = array("q")
+        self.affiliation_names: list[str] = []
+        self.affiliation_index: dict[str, int] = {}
+        # Latitude and longitude of every affiliation, interleaved.
+        self.coordinates = array("d")
+        self.happening_weights: list["array[float]"] = []
+
+    def write_happening(
+        self, happening: HappeningRow, rows: Iterable[StreamedRow]
+    ) -> None:
+        weights = array("d")
+        for i, (_, _, author_name, aff_name, aff_lat, aff_lon) in enumerate(rows):
+            index = self.affiliation_index.get(aff_name)
+            if index is None:
+                index = self.affiliation_index[aff_name] = len(self.affiliation_names)
+                self.affiliation_names.append(aff_name)
+                self.coordinates.extend((aff_lat, aff_lon))
+            if index >= len(weights):
+                weights.extend([0.0] * (index + 1 - len(weights)))
+            weights[index] += 1.0
+            prefix = "," if i else ""
+            self.submissions.write(
+                f"{prefix}{_dump([author_name, index])}".encode("utf-8")
+            )
+        self.happenings.append(happening)
+        self.submission_ends.append(self.submissions.tell())
+        self.happening_weights.append(weights)
+
+    def author_locations(self) -> AuthorLocations:
+        # The coordinates are viewed as an array without copying them.
+        coordinates = np.frombuffer(self.coordinates).reshape(-1, 2)
+        happening_weights = np.zeros((len(self.happenings), len(coordinates)))
+        for i, weights in enumerate(self.happening_weights):
+            happening_weights[i, : len(weights)] = np.frombuffer(weights)
+        return AuthorLocations(coordinates, happening_weights)
+
+    def chunks(self, suggestions: Suggestions) -> Iterator[bytes]:
+        """
+        Yields the output file in pieces, copying the spooled submissions of each
+        happening after its other fields.
+        """
+        header = {
+            "format_version": FORMAT_VERSION,
+            "conference_short_name": self.conf_name,
+            **suggestions["conference"],
+            "affiliations": {
+                "name": self.affiliation_names,
+                "latitude": [
+                    round(lat, COORDINATE_DECIMALS) for lat in self.coordinates[0::2]
+                ],
+                "longitude": [
+                    round(lon, COORDINATE_DECIMALS) for lon in self.coordinates[1::2]
+                ],
+            },
+        }
+        # Objects are written missing their closing brace, for the submissions to follow.
+        yield f'{_dump(header)[:-1]},"happenings":['.encode("utf-8")
+        self.submissions.seek(0)
+        start = 0
+        for i, (happening, fields, end) in enumerate(
+            zip(self.happenings, suggestions["happenings"], self.submission_ends)
+        ):
+            _, year, conf_city, conf_lat, conf_lon = happening
+            happening_data = {
+                "year": year,
+                "location": {
+                    "city": conf_city,
+                    "latitude": conf_lat,
+                    "longitude": conf_lon,
+                },
+                **fields,
             }
+            prefix = "," if i else ""
+            yield f'{prefix}{_dump(happening_data)[:-1]},"submissions":['.encode(
+                "utf-8"
+            )
+            while start < end:
+                chunk = self.submissions.read(min(STREAM_BUFFER_SIZE, end - start))
+                start += len(chunk)
+                yield chunk
+            yield b"]}"
+        yield b"]}"
+
 
-            # Write data to JSON file
-            output_f = os.path.join(OUTPUT_DIR, f"{conf_name}.json")
-            with open(output_f, "w") as f:
-                json.dump(output_data, f, indent=4)
-            print(f"Data for {conf_name} written to {output_f}")
+def _dump(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
 
-    except psycopg2.Error as e:
-        print(f"Database error: {e}")
-    except Exception as e:
-        print(f"Non database error: {e}")
+
+def write_streamed_output(path: str, chunks: Iterable[bytes]) -> None:
+    """
+    Like write_output, but compresses the JSON piece by piece as it is written.
+
+    The three files are written next to their final paths and only moved in place
+    once all of them are complete, so a failed export leaves the previous ones.
+    """
+    paths = [path, f"{path}.gz", f"{path}.br"]
+    tmp_paths = [f"{p}.{os.getpid()}.tmp" for p in paths]
+    compressor = brotli.Compressor(quality=11)
+    try:
+        with open(tmp_paths[0], "wb") as f, open(tmp_paths[1], "wb") as gz_file:
+            # Without a file name in the gzip header, which would differ between files.
+            with gzip.GzipFile(
+                "", "wb", compresslevel=9, fileobj=gz_file, mtime=0
+            ) as gz, open(tmp_paths[2], "wb") as br:
+                for chunk in chunks:
+                    f.write(chunk)
+                    gz.write(chunk)
+                    br.write(compressor.process(chunk))
+                br.write(compressor.finish())
+        for tmp_path, final_path in zip(tmp_paths, paths):
+            os.replace(tmp_path, final_path)
     finally:
-        if conn:
-            conn.close()
-            print("Database connection closed")
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def stream_conferences(
+    conn: Connection,
+    happenings_by_conf: dict[str, list[HappeningRow]],
+    conferences: list[str],
+    settings: SuggestionSettings,
+) -> dict[str, str]:
+    """
+    Exports the given conferences like export_conferences, but reads their submissions
+    through a server-side cursor in chunks and writes them out as they arrive, so that
+    memory use does not grow with the number of submissions.
+
+    Returns the conferences that could not be exported, with the reason.
+    """
+    failures: dict[str, str] = {}
+    # The conferences are walked in the order their rows come in: byte order, which is
+    # how the C collation sorts UTF-8 names.
+    conferences = sorted(conferences)
+    streamed: list[StreamedConference] = []
+    with conn.cursor(name="export_submissions") as cur:
+        cur.itersize = STREAM_CHUNK_SIZE
+        cur.execute(
+            f"""
+            WITH recent AS ({RECENT_HAPPENINGS_SQL})
+            SELECT
+                s.conference_short_name,
+                s.conference_year,
+                s.author_name,
+                s.affiliation_name,
+                s.latitude,
+                s.longitude
+            FROM
+                recent
+            JOIN
+                happening_submissions AS s
+                ON s.conference_short_name = recent.conference_short_name
+                AND s.conference_year = recent.year
+            WHERE
+                recent.conference_short_name = ANY(%(conferences)s)
+            ORDER BY
+                s.conference_short_name COLLATE "C",
+                s.conference_year DESC,
+                s.author_name COLLATE "C",
+                s.affiliation_name COLLATE "C";
+            """,
+            {"limit": HAPPENINGS_PER_CONFERENCE, "conferences": conferences},
+        )
+        groups = groupby(cur, key=lambda row: (row[0], row[1]))
+        group = next(groups, None)
+        for conf_name in conferences:
+            print(f"Conference: {conf_name}...")
+            conference = StreamedConference(conf_name)
+            streamed.append(conference)
+            # Happenings are most recent first, like their rows.
+            for happening in happenings_by_conf[conf_name]:
+                if group is None or group[0] != (conf_name, happening[1]):
+                    conference.write_happening(happening, ())
+                    continue
+                # The rows of a group must be consumed before moving to the next one.
+                conference.write_happening(happening, group[1])
+                group = next(groups, None)
+
+    suggestions = suggest_locations(
+        [conference.conf_name for conference in streamed],
+        [conference.author_locations() for conference in streamed],
+        settings,
+    )
+
+    for conference in streamed:
+        conf_name = conference.conf_name
+        output_f = os.path.join(OUTPUT_DIR, f"{conf_name}.json")
+        try:
+            write_streamed_output(output_f, conference.chunks(suggestions[conf_name]))
+        except OSError as e:
+            failures[conf_name] = f"Failed to write {output_f}: {e}"
+            continue
+        finally:
+            conference.submissions.close()
+        print(f"Data for {conf_name} written to {output_f}")
+
+    return failures
+
+
+def _export_conference_in_worker(
+    conf_name: str,
+    happenings: list[HappeningRow],
+    stream: bool,
+    settings: SuggestionSettings,
+) -> dict[str, str]:
+    # Each worker process has its own connection pool, so its connection is reused
+    # for every conference it handles.
+    def export(conn: Connection) -> dict[str, str]:
+        if stream:
+            return stream_conferences(
+                conn, {conf_name: happenings}, [conf_name], settings
+            )
+        with conn.cursor() as cur:
+            return export_conferences(
+                cur, {conf_name: happenings}, [conf_name], settings
+            )
+
+    return run_with_retry(export)
+
+
+def generate_json_for_frontend(
+    force: bool = False,
+    jobs: int = 1,
+    stream: bool = False,
+    settings: SuggestionSettings = SuggestionSettings(),
+) -> dict[str, str]:
+    """
+    Generates a JSON file for each conference and saves it to src/www/data/
+
+    Conferences whose data did not change since the previous export are skipped and
+    their files left untouched, unless force is set. With more than one job, the
+    conferences are exported in parallel by a pool of worker processes, each with its
+    own database connection. With stream set, submissions are streamed to the files
+    instead of being loaded in memory, see stream_conferences. Changing the settings
+    of the suggestions regenerates every file.
+
+    Returns the conferences that failed to export, with the reason.
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    # The connection is given back before exporting, so that with several jobs the
+    # workers' connections are the only ones in use.
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        # Everything is fetched in a few set-based queries and grouped here, so the
+        # number of round trips does not grow with the number of conferences.
+        happenings_by_conf = fetch_happenings(cur)
+        print(f"Found conferences: {list(happenings_by_conf.keys())}")
+        fingerprints = fetch_fingerprints(cur)
+
+    state = {} if force else load_export_state(settings)
+    changed = [
+        conf_name
+        for conf_name in happenings_by_conf
+        if state.get(conf_name) != fingerprints.get(conf_name)
+        or not os.path.exists(os.path.join(OUTPUT_DIR, f"{conf_name}.json"))
+    ]
+    for conf_name in happenings_by_conf:
+        if conf_name not in changed:
+            print(f"Conference: {conf_name} unchanged, skipping.")
+
+    def export(conn: Connection) -> dict[str, str]:
+        if stream:
+            return stream_conferences(conn, happenings_by_conf, changed, settings)
+        with conn.cursor() as cur:
+            return export_conferences(cur, happenings_by_conf, changed, settings)
+
+    failures: dict[str, str] = {}
+    if jobs <= 1:
+        failures = run_with_retry(export)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    _export_conference_in_worker,
+                    conf_name,
+                    happenings_by_conf[conf_name],
+                    stream,
+                    settings,
+                ): conf_name
+                for conf_name in changed
+            }
+            for future in as_completed(futures):
+                try:
+                    failures.update(future.result())
+                except Exception as e:
+                    failures[futures[future]] = f"Worker failed: {e}"
+
+    # Only successfully exported conferences are marked as up to date.
+    for conf_name in changed:
+        if conf_name not in failures:
+            state[conf_name] = fingerprints[conf_name]
+    save_export_state(state, settings)
+
+    for conf_name, reason in failures.items():
+        print(f"[ERROR] {conf_name}: {reason}")
+    return failures
 
 
 if __name__ == "__main__":
-    generate_json_for_frontend()
+    parser = argparse.ArgumentParser(
+        description="Export the database to one JSON file per conference for the website"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate every conference, even if its data did not change",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes exporting conferences in parallel",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Stream submissions from the database to the files in chunks, keeping "
+            "memory use flat for large conferences"
+        ),
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=DEFAULT_WINDOW,
+        help=(
+            "Number of happenings, counting back from each one, its rolling suggested "
+            "location is computed over"
+        ),
+    )
+    parser.add_argument(
+        "--recency-decay",
+        type=float,
+        default=1.0,
+        help=(
+            "Weight of the authors of a happening relative to those of the next one, "
+            "for the conference and rolling suggestions (1 weighs all the same)"
+        ),
+    )
+    args = parser.parse_args()
+    if args.window < 1:
+        parser.error("--window must be at least 1")
+    if args.recency_decay <= 0:
+        parser.error("--recency-decay must be positive")
+    settings = SuggestionSettings(args.window, args.recency_decay)
+    if generate_json_for_frontend(args.force, args.jobs, args.stream, settings):
+        sys.exit(1)
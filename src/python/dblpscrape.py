@@ -1,11 +1,32 @@
 import argparse
+import threading
 import time
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 import requests
+import requests.adapters
 from bs4 import BeautifulSoup
-from database_connection import open_connection
+from database_connection import get_connection
 from psycopg2.extensions import cursor as Cursor
+from psycopg2.extras import execute_values
 from typing import Optional, TypedDict
+from work_queue import (
+    DBLP_DETAILS_JOB,
+    claim_jobs,
+    complete_job,
+    enqueue_jobs,
+    fail_job,
+)
+
+# dblp asks crawlers to keep a low request rate and answers 429s otherwise.
+DBLP_REQUESTS_PER_SECOND = 1.0
+DEFAULT_RETRY_AFTER = 5.0
+MAX_RETRIES = 5
+REQUEST_TIMEOUT = 30
+
+# Number of rows sent per statement by bulk inserts.
+BULK_PAGE_SIZE = 1000
+# Number of publications claimed at once from the job queue.
+QUEUE_CLAIM_SIZE = 50
 
 
 class PaperDetails(TypedDict):
@@ -26,9 +47,7 @@ def get_publication_ids(url: str) -> list[str]:
     try:
         # Pretend we're a browser so the site is ok with our request
 
-        response: requests.Response = requests.get(
-            url, headers={"User-Agent": "My-DOI-Scraper/1.0"}
-        )
+        response: requests.Response = session.get(url, timeout=REQUEST_TIMEOUT)
         # Cathes error if the page is broken or something (like a 404 error)
 
         response.raise_for_status()
@@ -51,52 +70,149 @@ def get_publication_ids(url: str) -> list[str]:
         return []
 
 
-def get_details_from_xml(pub_id: str) -> Optional[PaperDetails]:
+class RateLimiter:
     """
-    Fetches the XML data for a publication and extracts the DOI.
+    Token bucket shared by every thread fetching from dblp.
+
+    A Retry-After received by any thread pauses all of them, since dblp rate limits
+    the client as a whole and not individual requests.
     """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Blocks until a request may be sent.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops every thread from sending requests for the given number of seconds.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+# Shared by every request to dblp, so connections are kept alive between requests.
+session = requests.Session()
+session.headers["User-Agent"] = "My-DOI-Scraper/1.0"
+session.mount(
+    "https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=16)
+)
+rate_limiter = RateLimiter(DBLP_REQUESTS_PER_SECOND)
+
+
+def _retry_after(response: requests.Response) -> float:
     try:
-        response: requests.Response = requests.get(
-            f"https://dblp.org/rec/{pub_id}.xml",
-            headers={"User-Agent": "My-DOI-Scraper/1.0"},
-        )
+        return float(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+    except ValueError:
+        # Retry-After may also be an HTTP date, just wait the default time then.
+        return DEFAULT_RETRY_AFTER
+
 
-        if response.status_code == 429:
-            retry_after: int = int(response.headers.get("Retry-After", 5))
+def get_details_from_xml(pub_id: str) -> Optional[PaperDetails]:
+    """
+    Fetches the XML data for a publication and extracts the DOI.
+
+    Requests go through the shared rate limiter, and rate limited or failed requests
+    are retried at most MAX_RETRIES times.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            response: requests.Response = session.get(
+                f"https://dblp.org/rec/{pub_id}.xml", timeout=REQUEST_TIMEOUT
+            )
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching XML for {pub_id} (attempt {attempt + 1}): {e}")
+            time.sleep(2**attempt)
+            continue
+
+        if response.status_code in (429, 503):
+            retry_after = _retry_after(response)
             print(f"Rate limited. Retrying after {retry_after} seconds.")
-            time.sleep(retry_after)
-            return get_details_from_xml(pub_id)  # Retry the request
-        response.raise_for_status()
+            rate_limiter.pause(retry_after)
+            continue
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            print(f"Error fetching XML for {pub_id}: {e}")
+            return None
+        return _parse_details(pub_id, response.content)
 
-        soup: BeautifulSoup = BeautifulSoup(response.content, "xml")
+    print(f"Giving up on {pub_id} after {MAX_RETRIES + 1} attempts.")
+    return None
 
-        ee_tag = soup.find("ee")
-        title = soup.find("title")
-        authors = [author.get_text(strip=True) for author in soup.find_all("author")]
 
-        if not authors:
-            print(f"No author found: https://dblp.org/rec/{pub_id}.xml")
-            return None
+def _parse_details(pub_id: str, content: bytes) -> Optional[PaperDetails]:
+    soup: BeautifulSoup = BeautifulSoup(content, "xml")
 
-        if not soup.find("author"):
-            print(f"No author found: https://dblp.org/rec/{pub_id}.xml")
-            return None
+    ee_tag = soup.find("ee")
+    title = soup.find("title")
+    authors = [author.get_text(strip=True) for author in soup.find_all("author")]
 
-        if title and ee_tag:
-            doi = ee_tag.text
-            assert doi.startswith("https://doi.org/")
-            doi = doi[16:]
-            return {
-                "doi": doi,
-                "title": title.text,
-                "dblp_pub_id": pub_id,
-                "authors": authors,
-            }
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching XML for {pub_id}: {e}")
+    if not authors:
+        print(f"No author found: https://dblp.org/rec/{pub_id}.xml")
+        return None
+
+    if title and ee_tag:
+        doi = ee_tag.text
+        assert doi.startswith("https://doi.org/")
+        doi = doi[16:]
+        return {
+            "doi": doi,
+            "title": title.text,
+            "dblp_pub_id": pub_id,
+            "authors": authors,
+        }
     return None
 
 
+def get_all_details_from_xml(
+    pub_ids: list[str], workers: int
+) -> list[Optional[PaperDetails]]:
+    """
+    Fetches the details of many publications concurrently.
+
+    The overall request rate is still bounded by the shared rate limiter, the workers
+    only allow requests to overlap with each other's latency.
+
+    Returns the details in the same order as pub_ids.
+    """
+    done = 0
+    lock = threading.Lock()
+
+    def fetch(pub_id: str) -> Optional[PaperDetails]:
+        nonlocal done
+        details = get_details_from_xml(pub_id)
+        with lock:
+            done += 1
+            print(f"Processed {done}/{len(pub_ids)}")
+        return details
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fetch, pub_ids))
+
+
 def ensure_conference_exists(
     cur: Cursor,
     conference_name: str,
@@ -129,35 +245,94 @@ def ensure_conference_exists(
         raise e
 
 
-def insert_paper(
-    cur: Cursor, paper: PaperDetails, conf_name: str, conf_year: int
-) -> bool:
+def insert_paper_authors(cur: Cursor, authors_by_doi: dict[str, list[str]]) -> None:
     """
-    Inserts a paper into the database. Skips insertion if the DOI already exists.
-    Returns True if a new record was inserted, False otherwise.
+    Stores the author lists of papers, in dblp order, so that later steps do not need
+    to fetch them from dblp again. All lists are written in a single statement.
     """
+    execute_values(
+        cur,
+        """
+        INSERT INTO paper_authors (paper_doi, position, author_name)
+        VALUES %s
+        ON CONFLICT (paper_doi, position) DO NOTHING;
+        """,
+        [
+            (doi, position, author)
+            for doi, authors in authors_by_doi.items()
+            for position, author in enumerate(authors)
+        ],
+        page_size=BULK_PAGE_SIZE,
+    )
+
+
+def insert_papers(
+    cur: Cursor, papers: list[PaperDetails], conf_name: str, conf_year: int
+) -> set[str]:
+    """
+    Inserts papers and their authors into the database in bulk. Papers whose DOI
+    already exists are skipped.
+    Returns the DOIs of the newly inserted papers.
+    """
+    # A DOI can show up twice when a dblp page lists the same paper twice, and a
+    # single INSERT may not touch the same row twice.
+    unique_papers = list({paper["doi"]: paper for paper in papers}.values())
     sql = """
         INSERT INTO papers (doi, title, conference_short_name, conference_year, dblp_pub_id)
-        VALUES (%s, %s, %s, %s, %s)
-        ON CONFLICT (doi) DO NOTHING;
+        VALUES %s
+        ON CONFLICT (doi) DO NOTHING
+        RETURNING doi;
     """
     # skipping duplicates with the ON CONFLICT clause
 
-    try:
-        cur.execute(
-            sql,
+    inserted = execute_values(
+        cur,
+        sql,
+        [
             (
                 paper["doi"],
                 paper["title"],
                 conf_name,
                 conf_year,
                 paper["dblp_pub_id"],
-            ),
-        )
-        return cur.rowcount > 0
-    except Exception as e:
-        print(f"Error during paper insertion: {e}")
-        return False
+            )
+            for paper in unique_papers
+        ],
+        page_size=BULK_PAGE_SIZE,
+        fetch=True,
+    )
+    # Also done for existing papers, in case they were scraped before author lists
+    # were stored.
+    insert_paper_authors(
+        cur, {paper["doi"]: paper["authors"] for paper in unique_papers}
+    )
+    return {doi for (doi,) in inserted}
+
+
+def store_papers(
+    cur: Cursor,
+    all_details: list[Optional[PaperDetails]],
+    conf_name: str,
+    conf_year: int,
+) -> tuple[int, int, int]:
+    """
+    Inserts the papers that could be fetched, in a handful of statements.
+
+    Returns the number of papers inserted, skipped because they already exist, and
+    skipped because their details could not be fetched.
+    """
+    papers = [details for details in all_details if details]
+    inserted = insert_papers(cur, papers, conf_name, conf_year)
+    for paper_details in papers:
+        if paper_details["doi"] in inserted:
+            print(f"Inserted new paper: {paper_details['doi']}")
+        else:
+            print(f"Skipped (already exists): {paper_details['doi']}")
+    return (
+        len(inserted),
+        len(papers) - len(inserted),
+        len(all_details) - len(papers),
+    )
 
 
 def main() -> None:
@@ -194,62 +369,94 @@ def main() -> None:
         help="The longitude of the conference location (listed on their website)",
     )
     parser.add_argument("--url", required=True, help="The full dblp.org URL to scrape.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of concurrent requests to dblp",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DBLP_REQUESTS_PER_SECOND,
+        help="Maximum number of requests per second to dblp",
+    )
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="Share the publications with other workers through the job queue",
+    )
     args = parser.parse_args()
+    rate_limiter.rate = args.rate
 
-    conn = None
     try:
-        conn = open_connection()
-        cur = conn.cursor()
-        print("Connected to DB")
-
-        ensure_conference_exists(
-            cur, args.conference, args.city, args.year, args.latitude, args.longitude
-        )
-        conn.commit()
-
-        print(f"Scraping publication IDs from: {args.url}")
-        publication_ids = get_publication_ids(args.url)
-
-        if not publication_ids:
-            print("No publication IDs found")
-            return
-        print(
-            f"Found {len(publication_ids)} publications. Starting to scrape for details"
-        )
-
-        inserted_count = 0
-        skipped_exist_count = 0
-        skipped_xmlfetch_count = 0
-
-        for i, pub_id in enumerate(publication_ids):
-            print(f"Processing {i + 1}/{len(publication_ids)}")
-            paper_details = get_details_from_xml(pub_id)
-
-            if paper_details:
-                if insert_paper(cur, paper_details, args.conference, args.year):
-                    print(f"Inserted new paper: {paper_details['doi']}")
-                    inserted_count += 1
-                else:
-                    print(f"Skipped (already exists): {paper_details['doi']}")
-                    skipped_exist_count += 1
+        with get_connection() as conn:
+            cur = conn.cursor()
+            print("Connected to DB")
+
+            ensure_conference_exists(
+                cur,
+                args.conference,
+                args.city,
+                args.year,
+                args.latitude,
+                args.longitude,
+            )
+            conn.commit()
+
+            print(f"Scraping publication IDs from: {args.url}")
+            publication_ids = get_publication_ids(args.url)
+
+            if not publication_ids:
+                print("No publication IDs found")
+                return
+            print(
+                f"Found {len(publication_ids)} publications. Starting to scrape for details"
+            )
+
+            if args.queue:
+                # Other workers started on the same conference share the publications.
+                enqueue_jobs(
+                    cur, DBLP_DETAILS_JOB, args.conference, args.year, publication_ids
+                )
+                conn.commit()
+                counts = [0, 0, 0]
+                while True:
+                    claimed = claim_jobs(
+                        cur,
+                        DBLP_DETAILS_JOB,
+                        args.conference,
+                        args.year,
+                        limit=QUEUE_CLAIM_SIZE,
+                    )
+                    conn.commit()
+                    if not claimed:
+                        break
+                    all_details = get_all_details_from_xml(claimed, args.workers)
+                    for i, count in enumerate(
+                        store_papers(cur, all_details, args.conference, args.year)
+                    ):
+                        counts[i] += count
+                    for pub_id, details in zip(claimed, all_details):
+                        if details:
+                            complete_job(cur, DBLP_DETAILS_JOB, pub_id)
+                        else:
+                            fail_job(cur, DBLP_DETAILS_JOB, pub_id, "XML fetch issue")
+                    conn.commit()
+                inserted_count, skipped_exist_count, skipped_xmlfetch_count = counts
             else:
-                print(f"Skipped (Couldn't fetch details from XML)")
-                skipped_xmlfetch_count += 1
-            time.sleep(1)
-        conn.commit()
-
-        print(f"New papers inserted: {inserted_count}")
-        print(f"Papers skipped (already in DB): {skipped_exist_count}")
-        print(f"Papers skipped (XML fetch issue): {skipped_xmlfetch_count}")
+                all_details = get_all_details_from_xml(publication_ids, args.workers)
+                inserted_count, skipped_exist_count, skipped_xmlfetch_count = (
+                    store_papers(cur, all_details, args.conference, args.year)
+                )
+                conn.commit()
+
+            print(f"New papers inserted: {inserted_count}")
+            print(f"Papers skipped (already in DB): {skipped_exist_count}")
+            print(f"Papers skipped (XML fetch issue): {skipped_xmlfetch_count}")
     except Exception as e:
+        # The transaction was rolled back when leaving the connection block.
         print(f"An unexpected error occurred: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
-            print("DB connection closed")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,18 @@
+import io
 import sys
+
 from pypdf import PdfReader, PdfWriter
 
 
-def extract_first_page_of_pdf(pdf: str, desired_path: str) -> None:
+def extract_first_page_of_pdf_to_bytes(pdf: str) -> bytes:
     """
-    Extracts the first page of a PDF file and saves it to a new file.
+    Extracts the first page of a PDF file as a new PDF document, in memory.
 
     Args:
         pdf (str): The path to the input PDF file.
-        desired_path (str): The path where the first page will be saved.
+
+    Returns:
+        bytes: The content of the single-page PDF.
     """
 
     reader = PdfReader(pdf)
@@ -18,9 +22,40 @@ def extract_first_page_of_pdf(pdf: str, desired_path: str) -> None:
     if len(reader.pages) > 0:
         writer.add_page(reader.pages[0])
 
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def extract_first_page_text(pdf: str) -> str:
+    """
+    Extracts the text of the first page of a PDF file, without writing anything.
+
+    Args:
+        pdf (str): The path to the input PDF file.
+
+    Returns:
+        str: The text of the first page, empty for scanned pages without a text layer.
+    """
+
+    reader = PdfReader(pdf)
+    if len(reader.pages) == 0:
+        return ""
+    return reader.pages[0].extract_text()
+
+
+def extract_first_page_of_pdf(pdf: str, desired_path: str) -> None:
+    """
+    Extracts the first page of a PDF file and saves it to a new file.
+
+    Args:
+        pdf (str): The path to the input PDF file.
+        desired_path (str): The path where the first page will be saved.
+    """
+
     # Write the first page to the desired path
     with open(desired_path, "wb") as output_pdf:
-        writer.write(output_pdf)
+        output_pdf.write(extract_first_page_of_pdf_to_bytes(pdf))
 
 
 if __name__ == "__main__":
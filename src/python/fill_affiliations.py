@@ -1,130 +1,396 @@
 import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, Optional
 
-from database_connection import open_connection
+import psycopg2
+from psycopg2.extras import execute_values
 
-from dblpscrape import get_details_from_xml
-from coords_entry import insert_affiliation
+from database_connection import get_connection
+
+from affiliation_cache import (
+    forget_affiliations,
+    get_cached_affiliations,
+    pdf_digest,
+    store_affiliations,
+)
+from dblpscrape import get_all_details_from_xml, insert_paper_authors
+from coords_entry import insert_affiliations
+from geocoding_cache import resolve_affiliations
+from canonicalize_affiliations import (
+    AffiliationIndex,
+    canonicalize,
+    load_affiliation_index,
+)
 from get_affiliation import get_affiliations
+from match_authors import match_authors
+from migrate import refresh_export_view
+from work_queue import (
+    AFFILIATIONS_JOB,
+    claim_jobs,
+    complete_job,
+    enqueue_jobs,
+    fail_job,
+)
 
 
-# This function has some printing for debugging purposes, in case something goes wrong.
-def main(args: argparse.Namespace) -> None:
-    connection = open_connection()
-    cursor = connection.cursor()
+def get_stored_authors(
+    cursor: psycopg2.extensions.cursor, conference: str, year: int
+) -> dict[str, list[str]]:
+    """
+    Gets the author lists stored by dblpscrape for every paper of a conference.
+
+    Returns the authors of each paper DOI, in dblp order.
+    """
     cursor.execute(
-        "SELECT doi, dblp_pub_id FROM papers WHERE conference_short_name = %s AND conference_year = %s",
-        (args.conference, args.year),
+        """
+        SELECT p_au.paper_doi, p_au.author_name
+        FROM paper_authors AS p_au
+        JOIN papers AS p ON p_au.paper_doi = p.doi
+        WHERE p.conference_short_name = %s AND p.conference_year = %s
+        ORDER BY p_au.paper_doi, p_au.position
+        """,
+        (conference, year),
+    )
+    authors: dict[str, list[str]] = {}
+    for doi, author_name in cursor.fetchall():
+        authors.setdefault(doi, []).append(author_name)
+    return authors
+
+
+def get_linked_author_counts(
+    cursor: psycopg2.extensions.cursor, conference: str, year: int
+) -> dict[str, int]:
+    """
+    Gets how many authors of each paper of a conference already have an affiliation.
+    """
+    cursor.execute(
+        """
+        SELECT p_a.paper_doi, COUNT(*)
+        FROM paper_affiliations AS p_a
+        JOIN papers AS p ON p_a.paper_doi = p.doi
+        WHERE p.conference_short_name = %s AND p.conference_year = %s
+        GROUP BY p_a.paper_doi
+        """,
+        (conference, year),
+    )
+    return {doi: count for doi, count in cursor.fetchall()}
+
+
+def insert_paper_affiliations(
+    cursor: psycopg2.extensions.cursor,
+    doi: str,
+    author_to_affiliation: dict[str, str],
+) -> set[str]:
+    """
+    Links the authors of a paper to their affiliations in a single statement.
+
+    Returns the authors that were linked, leaving out those that already were.
+    """
+    inserted = execute_values(
+        cursor,
+        """
+        INSERT INTO paper_affiliations (paper_doi, author_name, affiliation_name)
+        VALUES %s
+        ON CONFLICT DO NOTHING
+        RETURNING author_name
+        """,
+        [
+            (doi, author, affiliation)
+            for author, affiliation in author_to_affiliation.items()
+        ],
+        fetch=True,
+    )
+    return {author for (author,) in inserted}
+
+
+def locate_affiliations(
+    cursor: psycopg2.extensions.cursor, affiliations: list[str]
+) -> dict[str, Optional[tuple[float, float]]]:
+    """
+    Gets the coordinates of affiliations, geocoding the ones not in the database.
+
+    Returns the coordinates of each affiliation, None for those that could not be
+    geocoded.
+    """
+    resolved, _ = resolve_affiliations(cursor, affiliations)
+    return {affiliation: resolved[affiliation]["coords"] for affiliation in resolved}
+
+
+def save_paper_affiliations(
+    cursor: psycopg2.extensions.cursor,
+    doi: str,
+    authors: list[str],
+    affiliations: list[tuple[str, str]],
+    affiliation_index: AffiliationIndex,
+    errors: list[str],
+    digest: Optional[str] = None,
+) -> bool:
+    """
+    Matches the authors of a paper to the affiliations extracted from it, and writes
+    them to the database. Problems are printed and added to errors.
+
+    If the authors cannot be matched, the cached answer for the PDF with the given
+    digest is dropped, so that the next run asks OpenAI again.
+
+    Returns whether every author could be linked to an affiliation.
+    """
+    print("Authors and affiliations according to OpenAI:")
+    for i, (author_name, affiliation) in enumerate(affiliations):
+        print(f" {i + 1}. {author_name}: {affiliation}")
+
+    # Map dblp authors to affiliations authors by name similarity.
+    matching = match_authors(authors, [name for name, _ in affiliations])
+    if matching["problems"]:
+        print("[ERROR] Could not match all authors, skipping paper:")
+        for problem in matching["problems"]:
+            print(f" {problem}")
+            errors.append(f"{doi} / {problem}")
+        if digest is not None:
+            forget_affiliations(cursor, [digest])
+        return False
+    author_to_affiliation = {
+        author: affiliations[index][1]
+        for author, index in matching["assignment"].items()
+    }
+    # Reuse the existing name of affiliations already known under another one, if
+    # both are geocoded to the same place.
+    canonical = canonicalize(
+        affiliation_index,
+        list(author_to_affiliation.values()),
+        lambda affiliations: locate_affiliations(cursor, affiliations),
     )
+    author_to_affiliation = {
+        author: canonical[affiliation]
+        for author, affiliation in author_to_affiliation.items()
+    }
+    print("Mapped authors to affiliations:")
+    for author, affiliation in author_to_affiliation.items():
+        print(f" {author}: {affiliation}")
+
+    # First, insert into affiliations with location.
+    failures = insert_affiliations(cursor, list(author_to_affiliation.values()))
+    for author, affiliation in author_to_affiliation.items():
+        if affiliation in failures:
+            print(f"[ERROR] Failed to map affiliation: {affiliation}")
+            errors.append(f"{doi} / {author} / {affiliation}")
+    mapped = {
+        author: affiliation
+        for author, affiliation in author_to_affiliation.items()
+        if affiliation not in failures
+    }
 
-    print(f"Processing {cursor.rowcount} papers...")
+    # Then, insert into paper_affiliations.
+    inserted = insert_paper_affiliations(cursor, doi, mapped)
+    for author, affiliation in mapped.items():
+        if author in inserted:
+            print(f"Inserted entry for {doi}/{author}: {affiliation}")
+        else:
+            print(f"[ERROR] Looks like {doi}/{author} was already an entry...")
+            errors.append(f"{doi} / {author} / {affiliation} (Already in database?)")
+    return not failures
 
-    errors: list[str] = []
 
-    for entry in cursor.fetchall():
-        print("\n")
-        doi, dblp_pub_id = entry
-        print(f"Processing DOI: {doi}")
+def get_papers_to_process(
+    connection: psycopg2.extensions.connection,
+    cursor: psycopg2.extensions.cursor,
+    conference: str,
+    year: int,
+    workers: int,
+) -> list[tuple[str, list[str]]]:
+    """
+    Finds the papers of a conference that still need affiliations, fetching and
+    storing the author lists that are not in the database yet.
+
+    Returns the DOI and dblp authors of each paper to process.
+    """
+    stored_authors = get_stored_authors(cursor, conference, year)
+    linked_authors = get_linked_author_counts(cursor, conference, year)
+    cursor.execute(
+        "SELECT doi, dblp_pub_id FROM papers WHERE conference_short_name = %s AND conference_year = %s",
+        (conference, year),
+    )
+    papers: list[tuple[str, str]] = cursor.fetchall()
+
+    print(f"Processing {len(papers)} papers...")
+
+    # Papers scraped before author lists were stored need one more fetch.
+    missing = [(doi, pub_id) for doi, pub_id in papers if doi not in stored_authors]
+    if missing:
+        details = get_all_details_from_xml([pub_id for _, pub_id in missing], workers)
+        fetched = {doi: d["authors"] for (doi, _), d in zip(missing, details) if d}
+        insert_paper_authors(cursor, fetched)
+        connection.commit()
+        stored_authors.update(fetched)
 
-        details = get_details_from_xml(dblp_pub_id)
-        if not details:
+    todo: list[tuple[str, list[str]]] = []
+    for doi, _ in papers:
+        authors = stored_authors.get(doi)
+        if not authors:
             print(f"[WARNING] Skipping {doi} due to failed DBLP parsing.")
             continue
-        authors = details["authors"]
-        print("Authors according to DBLP:")
-        for i, author in enumerate(authors):
-            print(f" {i + 1}. {author}")
-
         # If paper exists with same number of authors in the database, skip it.
-        cursor.execute(
-            "SELECT COUNT(*) FROM paper_affiliations WHERE paper_doi = %s",
-            (doi,),
-        )
-        result = cursor.fetchone()
-        if result and result[0] == len(authors):
-            print(f"Paper already has affiliations in database. Skipping.")
+        if linked_authors.get(doi, 0) == len(authors):
+            print(f"Paper {doi} already has affiliations in database. Skipping.")
             continue
+        todo.append((doi, authors))
+    return todo
+
+
+def get_pdf_path(pdf_directory: str, doi: str) -> str:
+    return f"{pdf_directory}/{doi.replace('/', '_')}.pdf"
 
-        pdf_path = f"{args.pdf_directory}/{doi.replace('/', '_')}.pdf"
+
+def get_pdf_digests(
+    pdf_directory: str, dois: list[str], errors: list[str]
+) -> dict[str, str]:
+    """
+    Hashes the PDF of each paper, adding the papers whose PDF cannot be read to errors.
+
+    Returns the PDF digest of each readable paper DOI.
+    """
+    digests: dict[str, str] = {}
+    for doi in dois:
         try:
-            affiliations = get_affiliations(pdf_path)
-        except Exception as e:
-            print("[ERROR] Some error getting info from OpenAI.")
+            digests[doi] = pdf_digest(get_pdf_path(pdf_directory, doi))
+        except OSError as e:
+            print(f"[ERROR] Could not read the PDF of {doi}.")
             errors.append(f"{doi} / {str(e)}")
-            continue
-        print("Authors and affiliations according to OpenAI:")
-        for i, (author_name, affiliation) in enumerate(affiliations):
-            print(f" {i + 1}. {author_name}: {affiliation}")
-
-        # Map dblp authors to affiliations authors using cosine similarity matrix.
-        # Copilot wrote this part.
-        matrix = [
-            [
-                (
-                    sum(a * b for a, b in zip(author_vector, affiliation_vector))
-                    / (
-                        (sum(a * a for a in author_vector) ** 0.5)
-                        * (sum(b * b for b in affiliation_vector) ** 0.5)
-                    )
-                    if (
-                        sum(a * a for a in author_vector) > 0
-                        and sum(b * b for b in affiliation_vector) > 0
-                    )
-                    else 0.0
-                )
-                for affiliation_vector in [
-                    affiliation_name.encode("utf-8")
-                    for affiliation_name, _ in affiliations
-                ]
-            ]
-            for author_vector in [
-                author_name.encode("utf-8") for author_name in authors
-            ]
-        ]
-
-        print("Cosine similarity matrix:")
-        for row in matrix:
-            print(" ", ["{0:.2f}".format(value) for value in row])
-        # Assert max in unique in both dimensions.
-        assert all(row.count(max(row)) == 1 for row in matrix)
-        for col_index in range(len(matrix[0])):
-            col = [matrix[row_index][col_index] for row_index in range(len(matrix))]
-            assert col.count(max(col)) == 1
-        # Now, for each author, find the affiliation with the highest cosine similarity.
-        author_to_affiliation = {}
-        for author_index, row in enumerate(matrix):
-            max_index = row.index(max(row))
-            author_to_affiliation[authors[author_index]] = affiliations[max_index][1]
-        print("Mapped authors to affiliations:")
-        for author, affiliation in author_to_affiliation.items():
-            print(f" {author}: {affiliation}")
-
-        for author, affiliation in author_to_affiliation.items():
-            # First, insert into affiliations with location.
-            try:
-                insert_affiliation(cursor, affiliation)
-            except:
-                print(f"[ERROR] Failed to map affiliation: {affiliation}")
-                errors.append(f"{doi} / {author} / {affiliation}")
-                continue
-
-            # Then, insert into paper_affiliations.
-            cursor.execute(
-                """
-                    INSERT INTO paper_affiliations (paper_doi, author_name, affiliation_name)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT DO NOTHING
-                """,
-                (doi, author, affiliation),
+    return digests
+
+
+def print_paper(doi: str, authors: list[str]) -> None:
+    print("\n")
+    print(f"Processing DOI: {doi}")
+    print("Authors according to DBLP:")
+    for i, author in enumerate(authors):
+        print(f" {i + 1}. {author}")
+
+
+def claim_papers(
+    connection: psycopg2.extensions.connection,
+    cursor: psycopg2.extensions.cursor,
+    args: argparse.Namespace,
+    todo: list[tuple[str, list[str]]],
+) -> Iterator[list[tuple[str, list[str]]]]:
+    """
+    Shares the papers of a conference with the other workers through the job queue,
+    yielding the papers claimed by this one, a few at a time.
+    """
+    enqueue_jobs(
+        cursor, AFFILIATIONS_JOB, args.conference, args.year, [doi for doi, _ in todo]
+    )
+    connection.commit()
+    authors_by_doi = dict(todo)
+    while True:
+        dois = claim_jobs(
+            cursor,
+            AFFILIATIONS_JOB,
+            args.conference,
+            args.year,
+            limit=2 * args.concurrency,
+        )
+        connection.commit()
+        if not dois:
+            return
+        for doi in dois:
+            # Linked by another worker since it was queued.
+            if doi not in authors_by_doi:
+                complete_job(cursor, AFFILIATIONS_JOB, doi)
+        connection.commit()
+        yield [(doi, authors_by_doi[doi]) for doi in dois if doi in authors_by_doi]
+
+
+# This function has some printing for debugging purposes, in case something goes wrong.
+def main(args: argparse.Namespace) -> None:
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        affiliation_index = load_affiliation_index(cursor)
+        todo = get_papers_to_process(
+            connection, cursor, args.conference, args.year, args.concurrency
+        )
+        errors: list[str] = []
+        digests: dict[str, str] = {}
+
+        # Without a queue, this worker processes every paper.
+        chunks: Iterable[list[tuple[str, list[str]]]] = [todo]
+        if args.queue:
+            chunks = claim_papers(connection, cursor, args, todo)
+
+        def finish(doi: str, error: Optional[str], retry: bool = True) -> None:
+            if args.queue:
+                if error is None:
+                    complete_job(cursor, AFFILIATIONS_JOB, doi)
+                else:
+                    fail_job(cursor, AFFILIATIONS_JOB, doi, error, retry)
+            connection.commit()
+
+        def save(
+            doi: str, authors: list[str], affiliations: list[tuple[str, str]]
+        ) -> None:
+            linked = save_paper_affiliations(
+                cursor,
+                doi,
+                authors,
+                affiliations,
+                affiliation_index,
+                errors,
+                digests[doi],
             )
-            if cursor.rowcount == 1:
-                print(f"Inserted entry for {doi}/{author}: {affiliation}")
-            else:
-                print(f"[ERROR] Looks like {doi}/{author} was already an entry...")
-                errors.append(
-                    f"{doi} / {author} / {affiliation} (Already in database?)"
+            # Retrying does not help, these need to be added manually.
+            finish(doi, None if linked else "Some authors could not be linked", False)
+
+        # PDF preprocessing and LLM calls run in worker threads, while this thread writes
+        # the results of finished papers to the database. At most twice as many papers as
+        # workers are in flight, so results are written as they come.
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            in_flight: dict[Future[list[tuple[str, str]]], tuple[str, list[str]]] = {}
+
+            def write_finished() -> None:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    doi, authors = in_flight.pop(future)
+                    print_paper(doi, authors)
+
+                    try:
+                        affiliations = future.result()
+                    except Exception as e:
+                        print("[ERROR] Some error getting info from OpenAI.")
+                        errors.append(f"{doi} / {str(e)}")
+                        finish(doi, str(e))
+                        continue
+                    # Cache the answer first, so it is kept even if writing fails. It is
+                    # dropped again if the authors cannot be matched to it.
+                    store_affiliations(cursor, {digests[doi]: affiliations})
+                    connection.commit()
+                    save(doi, authors, affiliations)
+
+            for chunk in chunks:
+                # PDFs already processed with the same model and prompt, under any name,
+                # reuse the cached answer instead of calling OpenAI again.
+                chunk_digests = get_pdf_digests(
+                    args.pdf_directory, [doi for doi, _ in chunk], errors
                 )
+                digests.update(chunk_digests)
+                cached = get_cached_affiliations(cursor, list(chunk_digests.values()))
+                for doi, authors in chunk:
+                    if doi not in chunk_digests:
+                        # The PDF may not be downloaded yet.
+                        finish(doi, "Could not read the PDF")
+                    elif chunk_digests[doi] in cached:
+                        print_paper(doi, authors)
+                        print("Using cached affiliations.")
+                        save(doi, authors, cached[chunk_digests[doi]])
+                    else:
+                        pdf_path = get_pdf_path(args.pdf_directory, doi)
+                        future = executor.submit(get_affiliations, pdf_path)
+                        in_flight[future] = (doi, authors)
+                        if len(in_flight) >= 2 * args.concurrency:
+                            write_finished()
+            while in_flight:
+                write_finished()
 
-        # Commit.
+        # The export reads the submissions from this view.
+        refresh_export_view(cursor)
         connection.commit()
 
     print("\n\n")
@@ -138,4 +404,15 @@ if __name__ == "__main__":
     parser.add_argument("--conference", type=str, required=True)
     parser.add_argument("--year", type=int, required=True)
     parser.add_argument("--pdf-directory", type=str, required=True)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of papers whose affiliations are extracted concurrently",
+    )
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="Share the papers with other workers through the job queue",
+    )
     main(parser.parse_args())
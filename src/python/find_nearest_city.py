@@ -1,40 +1,272 @@
 import sys
 import csv
 import os
-from geometric_median import get_geometric_median_from_file
-from geopy.distance import geodesic  # type: ignore
+from functools import lru_cache
+from typing import NamedTuple, Optional, Sequence, TypedDict
 
+import numpy as np
+import numpy.typing as npt
+from scipy.spatial import cKDTree  # type: ignore
 
-def find_nearest_city(target_coords: tuple[float, float]) -> dict[str, str | float]:
+from geometric_median import (
+    EARTH_RADIUS_MILES,
+    Coordinates,
+    Weights,
+    get_geometric_median_from_file,
+    to_unit_vectors,
+)
 
-    cities_path = os.path.join(os.path.dirname(__file__), "worldcities.csv")
-    with open(cities_path, "r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        cities = list(reader)
+CITIES_PATH = os.path.join(os.path.dirname(__file__), "worldcities.csv")
+# Binary copy of the parsed CSV, rebuilt whenever the CSV changes.
+CITIES_CACHE_PATH = os.path.join(os.path.dirname(__file__), "worldcities.npz")
 
-    nearest_city = None
-    min_distance = float("inf")
-    for city in cities:
-        population = city.get("population")
-        if not population or float(population) < 1000000:
-            continue
-        city_coords = (float(city["lat"]), float(city["lng"]))
-        distance = geodesic(target_coords, city_coords).miles
+DEFAULT_MIN_POPULATION = 1000000
+# Upper bound on the size of the city-by-point distance blocks used for ranking. Blocks
+# that fit in the CPU cache are faster than a single large matrix.
+RANK_BLOCK_ELEMENTS = 1 << 16
 
-        if distance < min_distance:
-            min_distance = distance
-            nearest_city = city
 
-    if nearest_city is None:
-        return {}
+class City(TypedDict):
+    city: str
+    country: str
+    latitude: float
+    longitude: float
+    distance: float
 
-    return {
-        "city": nearest_city["city"],
-        "country": nearest_city["country"],
-        "latitude": nearest_city["lat"],
-        "longitude": nearest_city["lng"],
-        "distance": min_distance,
-    }
+
+class RankedCity(TypedDict):
+    city: str
+    country: str
+    latitude: float
+    longitude: float
+    # Weighted sum of the great-circle distances in miles from every point.
+    total_distance: float
+
+
+class CityTable(NamedTuple):
+    names: npt.NDArray[np.str_]
+    countries: npt.NDArray[np.str_]
+    latitudes: npt.NDArray[np.float64]
+    longitudes: npt.NDArray[np.float64]
+    populations: npt.NDArray[np.float64]
+
+
+def _chord_to_miles(chord: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    # Straight-line distance between unit vectors to great-circle distance.
+    return np.asarray(
+        2 * EARTH_RADIUS_MILES * np.arcsin(np.clip(np.asarray(chord) / 2, 0.0, 1.0)),
+        dtype=np.float64,
+    )
+
+
+def _miles_to_chord(miles: float) -> float:
+    return float(2 * np.sin(min(miles / EARTH_RADIUS_MILES, np.pi) / 2))
+
+
+def _parse_cities_csv(path: str) -> CityTable:
+    names, countries, latitudes, longitudes, populations = [], [], [], [], []
+    with open(path, "r", encoding="utf-8") as file:
+        for city in csv.DictReader(file):
+            population = city.get("population")
+            if not population:
+                continue
+            names.append(city["city"])
+            countries.append(city["country"])
+            latitudes.append(float(city["lat"]))
+            longitudes.append(float(city["lng"]))
+            populations.append(float(population))
+    return CityTable(
+        np.array(names, dtype=np.str_),
+        np.array(countries, dtype=np.str_),
+        np.array(latitudes, dtype=np.float64),
+        np.array(longitudes, dtype=np.float64),
+        np.array(populations, dtype=np.float64),
+    )
+
+
+def load_city_table(
+    path: str = CITIES_PATH, cache_path: str = CITIES_CACHE_PATH
+) -> CityTable:
+    """
+    Loads the cities with a known population, going through the binary cache when it
+    was built from the current version of the CSV file.
+    """
+    stat = os.stat(path)
+    signature = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            if np.array_equal(cache["signature"], signature):
+                return CityTable._make(cache[field] for field in CityTable._fields)
+    except Exception:
+        # A missing or unreadable cache is rebuilt.
+        pass
+
+    table = _parse_cities_csv(path)
+    # Several export workers may rebuild the cache at once, so each one writes its own
+    # file and moves it in place, and readers never see a partial one.
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, signature=signature, **table._asdict())
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write city cache {cache_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return table
+
+
+class CityIndex:
+    """
+    Spatial index over the cities above a population threshold.
+
+    Cities are stored as 3D unit vectors in a KD-tree. The straight-line distance between
+    unit vectors grows with the great-circle distance, so nearest neighbours in the tree
+    are nearest neighbours on the globe, without any per-city geodesic computation.
+    """
+
+    def __init__(self, table: CityTable, min_population: float) -> None:
+        keep = table.populations >= min_population
+        self.table = CityTable._make(column[keep] for column in table)
+        self.tree = cKDTree(
+            to_unit_vectors(self.table.latitudes, self.table.longitudes)
+        )
+
+    def __len__(self) -> int:
+        return len(self.table.names)
+
+    def _city(self, index: int, distance: float) -> City:
+        return {
+            "city": str(self.table.names[index]),
+            "country": str(self.table.countries[index]),
+            "latitude": float(self.table.latitudes[index]),
+            "longitude": float(self.table.longitudes[index]),
+            "distance": float(distance),
+        }
+
+    def nearest(
+        self, targets: Sequence[tuple[float, float]], k: int = 1
+    ) -> list[list[City]]:
+        """
+        Finds the k nearest cities to each of the target (latitude, longitude) pairs.
+
+        Returns one list per target, ordered by increasing distance in miles.
+        """
+        if not targets or len(self) == 0:
+            return [[] for _ in targets]
+        k = min(k, len(self))
+        points = to_unit_vectors(
+            [lat for lat, _ in targets], [lon for _, lon in targets]
+        )
+        chords, indices = self.tree.query(points, k=k)
+        chords = np.asarray(chords).reshape(len(targets), k)
+        indices = np.asarray(indices).reshape(len(targets), k)
+        miles = _chord_to_miles(chords)
+        return [
+            [self._city(int(i), d) for i, d in zip(row_indices, row_miles)]
+            for row_indices, row_miles in zip(indices, miles)
+        ]
+
+    def rank(
+        self,
+        coord_sets: Sequence[Coordinates],
+        weight_sets: Sequence[Weights],
+        k: int,
+    ) -> list[list[RankedCity]]:
+        """
+        Ranks every city by the weighted total great-circle distance from each set of
+        (latitude, longitude) points, as travelling from each point to the city would
+        cost.
+
+        The points of all sets are stacked, and the haversine distance from every city
+        to every point computed as one matrix product of unit vectors, a block of cities
+        at a time to bound memory. Summing the distances is then a product with a
+        (points, sets) matrix holding the weights of each set in its own column.
+
+        Returns the k cheapest cities for each set, cheapest first.
+        """
+        if not coord_sets or len(self) == 0:
+            return [[] for _ in coord_sets]
+        k = min(k, len(self))
+        point_sets = [
+            np.asarray(coords, dtype=np.float64).reshape(-1, 2) for coords in coord_sets
+        ]
+        points = np.concatenate(point_sets)
+        vectors = to_unit_vectors(points[:, 0], points[:, 1])
+        set_weights = np.zeros((len(points), len(point_sets)))
+        start = 0
+        for i, (set_points, weights) in enumerate(zip(point_sets, weight_sets)):
+            if len(weights) != len(set_points):
+                raise ValueError(f"Coordinate set {i} and its weights differ in length")
+            set_weights[start : start + len(weights), i] = weights
+            start += len(weights)
+
+        cities = self.tree.data
+        costs = np.empty((len(self), len(coord_sets)))
+        block = max(1, RANK_BLOCK_ELEMENTS // len(points))
+        for start in range(0, len(self), block):
+            # sin(d / 2R) = |a - b| / 2 = sqrt((1 - a.b) / 2) for unit vectors a, b.
+            halves = cities[start : start + block] @ vectors.T
+            np.subtract(1.0, halves, out=halves)
+            np.multiply(halves, 0.5, out=halves)
+            np.clip(halves, 0.0, 1.0, out=halves)
+            np.sqrt(halves, out=halves)
+            np.arcsin(halves, out=halves)
+            costs[start : start + block] = halves @ set_weights
+        costs *= 2 * EARTH_RADIUS_MILES
+
+        rankings: list[list[RankedCity]] = []
+        for column in costs.T:
+            cheapest = np.argpartition(column, k - 1)[:k]
+            cheapest = cheapest[np.argsort(column[cheapest])]
+            rankings.append(
+                [
+                    {
+                        "city": str(self.table.names[i]),
+                        "country": str(self.table.countries[i]),
+                        "latitude": float(self.table.latitudes[i]),
+                        "longitude": float(self.table.longitudes[i]),
+                        "total_distance": float(column[i]),
+                    }
+                    for i in cheapest
+                ]
+            )
+        return rankings
+
+    def within_radius(
+        self, target: tuple[float, float], radius_miles: float
+    ) -> list[City]:
+        """
+        Finds every city within radius_miles of the target, ordered by distance.
+        """
+        if len(self) == 0:
+            return []
+        point = to_unit_vectors(target[0], target[1])
+        indices = np.asarray(
+            self.tree.query_ball_point(point, _miles_to_chord(radius_miles)),
+            dtype=np.int64,
+        )
+        if indices.size == 0:
+            return []
+        miles = _chord_to_miles(np.linalg.norm(self.tree.data[indices] - point, axis=1))
+        order = np.argsort(miles)
+        return [self._city(int(indices[i]), miles[i]) for i in order]
+
+
+@lru_cache(maxsize=None)
+def get_city_index(min_population: float = DEFAULT_MIN_POPULATION) -> CityIndex:
+    """
+    Returns the city index for a population threshold, building it on first use.
+    """
+    return CityIndex(load_city_table(), min_population)
+
+
+def find_nearest_city(
+    target_coords: tuple[float, float],
+    min_population: float = DEFAULT_MIN_POPULATION,
+) -> Optional[City]:
+    [nearest] = get_city_index(min_population).nearest([target_coords])
+    return nearest[0] if nearest else None
 
 
 if __name__ == "__main__":
@@ -42,7 +274,7 @@ if __name__ == "__main__":
         print(f"Usage: {sys.argv[0]} <path_to_json>")
         sys.exit(1)
     JSON_path = sys.argv[1]
-    median_coords, total_distance = get_geometric_median_from_file(JSON_path)
-    print(f"Geometric Median Coordinates: {median_coords}")
-    city = find_nearest_city(median_coords)
+    result = get_geometric_median_from_file(JSON_path)
+    print(f"Geometric Median Coordinates: {result['median']}")
+    city = find_nearest_city(result["median"])
     print(city)
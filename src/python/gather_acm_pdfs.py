@@ -2,7 +2,8 @@ import argparse
 import pywinauto  # type: ignore
 import time
 
-from database_connection import open_connection
+from database_connection import get_connection
+from work_queue import ACM_PDF_JOB, claim_jobs, complete_job, enqueue_jobs, fail_job
 
 BROWSER_PATH = r"C:\Program Files\Mozilla Firefox\firefox.exe"
 
@@ -27,18 +28,45 @@ def download_pdf(url: str, name: str) -> None:
 
 
 def main(args: argparse.Namespace) -> None:
-    connection = open_connection()
-    cursor = connection.cursor()
-    cursor.execute(
-        "SELECT doi FROM papers WHERE conference_short_name = %s AND conference_year = %s",
-        (args.conference, args.year),
-    )
-    for [doi] in cursor.fetchall():
-        download_pdf(f"https://dl.acm.org/doi/pdf/{doi}", f"{doi.replace('/', '_')}")
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT doi FROM papers WHERE conference_short_name = %s AND conference_year = %s",
+            (args.conference, args.year),
+        )
+        dois = [doi for [doi] in cursor.fetchall()]
+        if not args.queue:
+            for doi in dois:
+                download_pdf(
+                    f"https://dl.acm.org/doi/pdf/{doi}", f"{doi.replace('/', '_')}"
+                )
+            return
+
+        # Downloads are shared with the other workers, and resume after a restart.
+        enqueue_jobs(cursor, ACM_PDF_JOB, args.conference, args.year, dois)
+        connection.commit()
+        while claimed := claim_jobs(cursor, ACM_PDF_JOB, args.conference, args.year):
+            connection.commit()
+            [doi] = claimed
+            try:
+                download_pdf(
+                    f"https://dl.acm.org/doi/pdf/{doi}", f"{doi.replace('/', '_')}"
+                )
+            except Exception as e:
+                print(f"[ERROR] Failed to download {doi}: {e}")
+                fail_job(cursor, ACM_PDF_JOB, doi, str(e))
+            else:
+                complete_job(cursor, ACM_PDF_JOB, doi)
+            connection.commit()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--conference", type=str, required=True)
     parser.add_argument("--year", type=int, required=True)
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="Share the downloads with other workers through the job queue",
+    )
     main(parser.parse_args())
@@ -0,0 +1,168 @@
+import sys
+from datetime import timedelta
+from typing import Optional, TypedDict
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from database_connection import get_connection
+from get_coords_from_affiliation import GEOCODING_PROVIDER, geocode_affiliation
+
+# How long geocoding results are trusted. Misses expire sooner, since the provider
+# may learn about the place, or the affiliation may get fixed by hand.
+FOUND_TTL = timedelta(days=365)
+NOT_FOUND_TTL = timedelta(days=30)
+
+
+class ResolvedAffiliation(TypedDict):
+    # Whether the affiliation is already in the affiliations table.
+    known: bool
+    # None when the affiliation could not be geocoded.
+    coords: Optional[tuple[float, float]]
+    # Where the coordinates come from: "affiliations", "cache" or the provider name.
+    source: str
+
+
+def lookup_affiliations(
+    cursor: psycopg2.extensions.cursor, affiliations: list[str]
+) -> dict[str, ResolvedAffiliation]:
+    """
+    Resolves affiliations against the affiliations table and the geocoding cache, in a
+    single query.
+
+    Returns the affiliations that are known or have an unexpired cache entry. The
+    others need to be geocoded.
+    """
+    cursor.execute(
+        """
+        SELECT
+            q.name,
+            aff.affiliation_name IS NOT NULL,
+            COALESCE(aff.latitude, cache.latitude),
+            COALESCE(aff.longitude, cache.longitude),
+            cache.found
+        FROM
+            unnest(%(names)s::text[]) AS q(name)
+        LEFT JOIN
+            affiliations AS aff ON aff.affiliation_name = q.name
+        LEFT JOIN
+            geocoding_cache AS cache ON cache.query = q.name
+            AND cache.fetched_at > now() - CASE
+                WHEN cache.found THEN %(found_ttl)s
+                ELSE %(not_found_ttl)s
+            END
+        """,
+        {
+            "names": list(set(affiliations)),
+            "found_ttl": FOUND_TTL,
+            "not_found_ttl": NOT_FOUND_TTL,
+        },
+    )
+    resolved: dict[str, ResolvedAffiliation] = {}
+    for name, known, latitude, longitude, found in cursor.fetchall():
+        if known:
+            resolved[name] = {
+                "known": True,
+                "coords": (latitude, longitude),
+                "source": "affiliations",
+            }
+        elif found is not None:
+            resolved[name] = {
+                "known": False,
+                "coords": (latitude, longitude) if found else None,
+                "source": "cache",
+            }
+    return resolved
+
+
+def resolve_affiliations(
+    cursor: psycopg2.extensions.cursor, affiliations: list[str]
+) -> tuple[dict[str, ResolvedAffiliation], dict[str, str]]:
+    """
+    Resolves the coordinates of affiliations, only calling the geocoding provider for
+    those that are neither known nor cached. Every provider answer, found or not, is
+    stored in the cache.
+
+    Returns the resolved affiliations, and the affiliations the provider failed on
+    with the error. Failures are not cached, so they are retried on the next run.
+    """
+    resolved = lookup_affiliations(cursor, affiliations)
+
+    failures: dict[str, str] = {}
+    new_entries: list[tuple[str, Optional[float], Optional[float], bool, str, str]] = []
+    for affiliation in dict.fromkeys(affiliations):
+        if affiliation in resolved:
+            continue
+        try:
+            location = geocode_affiliation(affiliation)
+        except Exception as e:
+            failures[affiliation] = f"Geocoding failed: {e}"
+            continue
+        coords: Optional[tuple[float, float]] = None
+        if location:
+            coords = (location["latitude"], location["longitude"])
+            new_entries.append(
+                (
+                    affiliation,
+                    location["latitude"],
+                    location["longitude"],
+                    True,
+                    GEOCODING_PROVIDER,
+                    location["address"],
+                )
+            )
+        else:
+            new_entries.append((affiliation, None, None, False, GEOCODING_PROVIDER, ""))
+        resolved[affiliation] = {
+            "known": False,
+            "coords": coords,
+            "source": GEOCODING_PROVIDER,
+        }
+
+    execute_values(
+        cursor,
+        """
+        INSERT INTO geocoding_cache
+            (query, latitude, longitude, found, provider, address, fetched_at)
+        VALUES %s
+        ON CONFLICT (query) DO UPDATE SET
+            latitude = EXCLUDED.latitude,
+            longitude = EXCLUDED.longitude,
+            found = EXCLUDED.found,
+            provider = EXCLUDED.provider,
+            address = EXCLUDED.address,
+            fetched_at = EXCLUDED.fetched_at
+        """,
+        new_entries,
+        template="(%s, %s, %s, %s, %s, %s, now())",
+    )
+    return resolved, failures
+
+
+def main() -> None:
+    if len(sys.argv) < 2 or sys.argv[1] not in ("show", "forget"):
+        print("Usage: python geocoding_cache.py show|forget <affiliation>...")
+        sys.exit(1)
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if sys.argv[1] == "show":
+            cursor.execute(
+                """
+                SELECT query, found, latitude, longitude, provider, address, fetched_at
+                FROM geocoding_cache
+                WHERE query = ANY(%s)
+                """,
+                (sys.argv[2:],),
+            )
+            for row in cursor.fetchall():
+                print(row)
+        else:
+            cursor.execute(
+                "DELETE FROM geocoding_cache WHERE query = ANY(%s)", (sys.argv[2:],)
+            )
+            print(f"Removed {cursor.rowcount} cache entries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,384 @@
 import sys
 import json
-import math
+from typing import Optional, Sequence, TypedDict, Union
 
+import numpy as np
+import numpy.typing as npt
 
-def calculate_geometric_median_from_coords(
-    coords: list[tuple[float, float]],
-) -> tuple[tuple[float, float], float]:
+# Coordinates can also be given as an (n, 2) array, and weights as an (n,) array.
+Coordinates = Union[Sequence[tuple[float, float]], npt.NDArray[np.float64]]
+Weights = Union[Sequence[float], npt.NDArray[np.float64]]
+
+EARTH_RADIUS_KM = 6371.0
+EARTH_RADIUS_MILES = 3958.8
+
+
+class MedianResult(TypedDict):
+    median: tuple[float, float]
+    total_distance: float
+    iterations: int
+    converged: bool
+
+
+class SphericalMedianResult(TypedDict):
+    median: tuple[float, float]
+    total_distance_km: float
+    total_distance_miles: float
+    iterations: int
+    converged: bool
+
+
+def to_unit_vectors(
+    latitudes: npt.ArrayLike, longitudes: npt.ArrayLike
+) -> npt.NDArray[np.float64]:
     """
-    Calculates the geometric median from a list of coordinates.
+    Converts latitudes and longitudes in degrees to 3D unit vectors.
     """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack(
+        [cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1
+    )
 
-    # Initial estimate: centroid
-    x = sum(p[0] for p in coords) / len(coords)
-    y = sum(p[1] for p in coords) / len(coords)
 
-    # Convergence parameters
-    tolerance = 1e-7
-    max_iterations = 1000
+def to_coordinates(
+    vectors: npt.NDArray[np.float64],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Converts 3D unit vectors back to latitudes and longitudes in degrees.
+    """
+    latitudes = np.degrees(np.arcsin(np.clip(vectors[..., 2], -1.0, 1.0)))
+    longitudes = np.degrees(np.arctan2(vectors[..., 1], vectors[..., 0]))
+    return latitudes, longitudes
+
+
+def _angles_between(
+    a: npt.NDArray[np.float64], b: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    # Great-circle angle from the chord, which unlike arccos of the dot product stays
+    # accurate for nearby points.
+    differences = a - b
+    chords = np.sqrt(np.einsum("...k,...k->...", differences, differences))
+    return np.asarray(2 * np.arcsin(np.clip(chords / 2, 0.0, 1.0)), dtype=np.float64)
+
+
+def calculate_geometric_medians(
+    coord_sets: Sequence[Coordinates],
+    weight_sets: Optional[Sequence[Optional[Weights]]] = None,
+    tolerance: float = 1e-7,
+    max_iterations: int = 1000,
+) -> list[MedianResult]:
+    """
+    Calculates the weighted geometric median of many coordinate sets at once.
+
+    All sets are padded into a single (sets, points, 2) array and solved together with
+    Weiszfeld's algorithm, using the Vardi-Zhang modification so that an estimate landing
+    on a data point keeps iterating instead of stopping there. Sets that have converged
+    are dropped from the active batch, so the cost of an iteration only depends on the
+    sets still running.
 
+    Args:
+        coord_sets: One list, or (n, 2) array, of (x, y) coordinates per set. Sets must
+            not be empty.
+        weight_sets: Optional per-point weights for each set. A set with weights None,
+            or no weights at all, weighs every point 1.
+        tolerance: Stop iterating a set once its estimate moves less than this.
+        max_iterations: Upper bound on the number of iterations for any set.
+
+    Returns:
+        One result per set, with the median, the weighted sum of distances to it, the
+        number of iterations used and whether the set converged within max_iterations.
+    """
+    if not coord_sets:
+        return []
+
+    points, weights = _pad_sets(coord_sets, weight_sets)
+    n_sets = len(coord_sets)
+
+    # Initial estimate: weighted centroid
+    estimates = (weights[:, :, None] * points).sum(axis=1) / weights.sum(axis=1)[
+        :, None
+    ]
+    iterations = np.zeros(n_sets, dtype=np.int64)
+    converged = np.zeros(n_sets, dtype=bool)
+
+    # Work on compacted copies of the sets still running, so that finished sets are not
+    # carried through every later iteration.
+    active = np.arange(n_sets)
+    xs, ys, active_weights = points[:, :, 0], points[:, :, 1], weights
+    current = estimates.copy()
     for _ in range(max_iterations):
-        num_x = 0.0
-        num_y = 0.0
-        denom = 0.0
-        for px, py in coords:
-            dist = math.hypot(x - px, y - py)
-            # Avoid division by zero
-            if dist < tolerance:
-                return (px, py), sum(math.hypot(px - cx, py - cy) for cx, cy in coords)
-            weight = 1 / dist
-            num_x += px * weight
-            num_y += py * weight
-            denom += weight
-
-        new_x = num_x / denom
-        new_y = num_y / denom
-
-        if math.hypot(new_x - x, new_y - y) < tolerance:
-            x, y = new_x, new_y
+        if active.size == 0:
             break
+        current, steps = _weiszfeld_step(xs, ys, active_weights, current, tolerance)
+        estimates[active] = current
+        iterations[active] += 1
+        done = steps < tolerance
+        if done.any():
+            converged[active[done]] = True
+            running = ~done
+            active = active[running]
+            xs, ys = xs[running], ys[running]
+            active_weights, current = active_weights[running], current[running]
+
+    distances = np.hypot(
+        points[:, :, 0] - estimates[:, None, 0], points[:, :, 1] - estimates[:, None, 1]
+    )
+    total_distances = (weights * distances).sum(axis=1)
+
+    return [
+        {
+            "median": (float(estimates[i, 0]), float(estimates[i, 1])),
+            "total_distance": float(total_distances[i]),
+            "iterations": int(iterations[i]),
+            "converged": bool(converged[i]),
+        }
+        for i in range(n_sets)
+    ]
+
+
+def _pad_sets(
+    coord_sets: Sequence[Coordinates],
+    weight_sets: Optional[Sequence[Optional[Weights]]],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Pads coordinate sets into a single (sets, points, 2) array, along with a (sets,
+    points) array of their weights.
+    """
+    n_sets = len(coord_sets)
+    n_points = max(len(coords) for coords in coord_sets)
+    points = np.zeros((n_sets, n_points, 2))
+    # Padding points get a weight of 0 so that they never contribute.
+    weights = np.zeros((n_sets, n_points))
+    for i, coords in enumerate(coord_sets):
+        if len(coords) == 0:
+            raise ValueError(f"Coordinate set {i} is empty")
+        points[i, : len(coords)] = coords
+        set_weights = weight_sets[i] if weight_sets is not None else None
+        if set_weights is None:
+            weights[i, : len(coords)] = 1.0
+        else:
+            if len(set_weights) != len(coords):
+                raise ValueError(f"Coordinate set {i} and its weights differ in length")
+            weights[i, : len(coords)] = set_weights
+    if (weights < 0).any() or (weights.sum(axis=1) <= 0).any():
+        raise ValueError("Weights must be non-negative with a positive total per set")
+    return points, weights
+
+
+def _weiszfeld_step(
+    xs: npt.NDArray[np.float64],
+    ys: npt.NDArray[np.float64],
+    weights: npt.NDArray[np.float64],
+    estimates: npt.NDArray[np.float64],
+    tolerance: float,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Runs one modified Weiszfeld iteration on a batch of sets.
+
+    Returns the new estimates and how far each of them moved.
+    """
+    dx = xs - estimates[:, 0:1]
+    dy = ys - estimates[:, 1:2]
+    distances = np.hypot(dx, dy)
+    coincident = distances < tolerance
 
-        x, y = new_x, new_y
+    # Points sitting on the current estimate are left out of the usual update and
+    # handled through their total weight (eta) instead.
+    inverse = weights / np.maximum(distances, tolerance)
+    inverse[coincident] = 0.0
+    denominators = inverse.sum(axis=1)
+    eta = (weights * coincident).sum(axis=1)
 
-    total_distance = sum(math.hypot(x - px, y - py) for px, py in coords)
-    return (x, y), total_distance
+    # Every weighted point coincides with the estimate: it is the median.
+    degenerate = denominators <= 0
+    safe_denominators = np.where(degenerate, 1.0, denominators)
+    pull_x = (inverse * dx).sum(axis=1)
+    pull_y = (inverse * dy).sum(axis=1)
+    target_x = estimates[:, 0] + pull_x / safe_denominators
+    target_y = estimates[:, 1] + pull_y / safe_denominators
+
+    # Vardi-Zhang: r is the norm of the pull exerted by the non-coincident points. If it
+    # does not exceed eta, the estimate is already optimal and gamma is 1.
+    r = np.hypot(pull_x, pull_y)
+    gamma = np.where(r > 0, np.minimum(1.0, eta / np.where(r > 0, r, 1.0)), 1.0)
+    gamma = np.where(eta > 0, gamma, 0.0)
+    gamma = np.where(degenerate, 1.0, gamma)
+
+    new_estimates = np.empty_like(estimates)
+    new_estimates[:, 0] = (1.0 - gamma) * target_x + gamma * estimates[:, 0]
+    new_estimates[:, 1] = (1.0 - gamma) * target_y + gamma * estimates[:, 1]
+    steps = np.hypot(
+        new_estimates[:, 0] - estimates[:, 0], new_estimates[:, 1] - estimates[:, 1]
+    )
+    return new_estimates, steps
+
+
+def calculate_spherical_geometric_medians(
+    coord_sets: Sequence[Coordinates],
+    weight_sets: Optional[Sequence[Optional[Weights]]] = None,
+    initial_estimates: Optional[Sequence[Optional[tuple[float, float]]]] = None,
+    tolerance: float = 1e-9,
+    max_iterations: int = 1000,
+) -> list[SphericalMedianResult]:
+    """
+    Calculates the weighted geometric median on the globe of many sets of (latitude,
+    longitude) coordinates at once, minimizing the sum of great-circle distances.
+
+    Points are converted to 3D unit vectors and all sets solved together with the
+    Riemannian version of Weiszfeld's algorithm: each iteration averages the directions
+    towards the points in the plane tangent to the sphere at the estimate, and moves
+    along the great circle in that direction. Like calculate_geometric_medians, it uses
+    the Vardi-Zhang modification and drops converged sets from the active batch.
+    Unlike planar coordinates, this holds across the antimeridian and near the poles.
+
+    Args:
+        coord_sets: One list, or (n, 2) array, of (latitude, longitude) coordinates in
+            degrees per set. Sets must not be empty.
+        weight_sets: Optional per-point weights for each set. A set with weights None,
+            or no weights at all, weighs every point 1.
+        initial_estimates: Optional (latitude, longitude) to start each set from, for
+            example a previous median of similar points. Sets without one start from
+            the normalized weighted mean of their unit vectors.
+        tolerance: Stop iterating a set once its estimate moves less than this angle,
+            in radians.
+        max_iterations: Upper bound on the number of iterations for any set.
+
+    Returns:
+        One result per set, with the median, the weighted sum of great-circle distances
+        to it in kilometers and miles, the number of iterations used and whether the set
+        converged within max_iterations.
+    """
+    if not coord_sets:
+        return []
+
+    coordinates, weights = _pad_sets(coord_sets, weight_sets)
+    points = to_unit_vectors(coordinates[:, :, 0], coordinates[:, :, 1])
+    n_sets = len(coord_sets)
+
+    estimates = (weights[:, :, None] * points).sum(axis=1)
+    norms = np.linalg.norm(estimates, axis=1)
+    # Points spread evenly around the globe average out to nothing, start from the
+    # heaviest one then.
+    spread = norms < 1e-12
+    heaviest = points[np.arange(n_sets), weights.argmax(axis=1)]
+    estimates = np.where(
+        spread[:, None], heaviest, estimates / np.where(spread, 1.0, norms)[:, None]
+    )
+    if initial_estimates is not None:
+        for i, initial in enumerate(initial_estimates):
+            if initial is not None:
+                estimates[i] = to_unit_vectors(initial[0], initial[1])
+    iterations = np.zeros(n_sets, dtype=np.int64)
+    converged = np.zeros(n_sets, dtype=bool)
+
+    active = np.arange(n_sets)
+    active_points, active_weights = points, weights
+    current = estimates.copy()
+    for _ in range(max_iterations):
+        if active.size == 0:
+            break
+        current, steps = _spherical_weiszfeld_step(
+            active_points, active_weights, current, tolerance
+        )
+        estimates[active] = current
+        iterations[active] += 1
+        done = steps < tolerance
+        if done.any():
+            converged[active[done]] = True
+            running = ~done
+            active = active[running]
+            active_points, active_weights = (
+                active_points[running],
+                active_weights[running],
+            )
+            current = current[running]
+
+    total_angles = (weights * _angles_between(points, estimates[:, None, :])).sum(
+        axis=1
+    )
+    latitudes, longitudes = to_coordinates(estimates)
+
+    return [
+        {
+            "median": (float(latitudes[i]), float(longitudes[i])),
+            "total_distance_km": float(total_angles[i] * EARTH_RADIUS_KM),
+            "total_distance_miles": float(total_angles[i] * EARTH_RADIUS_MILES),
+            "iterations": int(iterations[i]),
+            "converged": bool(converged[i]),
+        }
+        for i in range(n_sets)
+    ]
+
+
+def _spherical_weiszfeld_step(
+    points: npt.NDArray[np.float64],
+    weights: npt.NDArray[np.float64],
+    estimates: npt.NDArray[np.float64],
+    tolerance: float,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Runs one modified Weiszfeld iteration on the sphere on a batch of sets.
+
+    Returns the new estimates and the angle each of them moved by.
+    """
+    angles = _angles_between(points, estimates[:, None, :])
+    coincident = angles < tolerance
+
+    # The unit direction from the estimate towards a point, in its tangent plane, is
+    # the tangent component of the point divided by the sine of their angle. Antipodal
+    # points pull in no particular direction and are left out.
+    sines = np.sin(angles)
+    usable = ~coincident & (sines > 1e-15)
+    coefficients = np.where(usable, weights / np.where(usable, sines, 1.0), 0.0)
+    dots = np.einsum("spk,sk->sp", points, estimates)
+    # The weighted sum of the directions, with the tangent components p - (p.x) x
+    # summed without building them.
+    pull = (
+        np.einsum("sp,spk->sk", coefficients, points)
+        - np.einsum("sp,sp->s", coefficients, dots)[:, None] * estimates
+    )
+
+    # The logarithmic map of a point is its direction times its angle, so weighting it
+    # by 1 / angle as in the planar update leaves the weighted direction.
+    inverse = np.where(usable, weights / np.maximum(angles, tolerance), 0.0)
+    denominators = inverse.sum(axis=1)
+    eta = (weights * coincident).sum(axis=1)
+
+    degenerate = denominators <= 0
+    safe_denominators = np.where(degenerate, 1.0, denominators)
+
+    # Vardi-Zhang, as in _weiszfeld_step: the step is shortened by eta / r.
+    r = np.linalg.norm(pull, axis=1)
+    gamma = np.where(r > 0, np.minimum(1.0, eta / np.where(r > 0, r, 1.0)), 1.0)
+    gamma = np.where(eta > 0, gamma, 0.0)
+    gamma = np.where(degenerate, 1.0, gamma)
+
+    # Follow the great circle along the tangent step (the exponential map).
+    step = ((1.0 - gamma) / safe_denominators)[:, None] * pull
+    steps = np.linalg.norm(step, axis=1)
+    safe_steps = np.where(steps > 0, steps, 1.0)
+    new_estimates = (
+        np.cos(steps)[:, None] * estimates
+        + (np.sin(steps) / safe_steps)[:, None] * step
+    )
+    new_estimates /= np.linalg.norm(new_estimates, axis=1)[:, None]
+    return new_estimates, steps
+
+
+def calculate_geometric_median_from_coords(
+    coords: list[tuple[float, float]],
+) -> SphericalMedianResult:
+    """
+    Calculates the geometric median on the globe from a list of (latitude, longitude)
+    coordinates.
+    """
+    [result] = calculate_spherical_geometric_medians([coords])
+    return result
 
 
-def get_geometric_median_from_file(JSON_path: str) -> tuple[tuple[float, float], float]:
+def get_geometric_median_from_file(JSON_path: str) -> SphericalMedianResult:
     """
     This function handles reading a file and then calls the core logic function.
     It's used when running this script as a standalone tool.
@@ -65,6 +398,9 @@ if __name__ == "__main__":
         print(f"Usage: {sys.argv[0]} <path_to_json>")
         sys.exit(1)
     JSON_path = sys.argv[1]
-    median_coords, total_distance = get_geometric_median_from_file(JSON_path)
-    print(f"Geometric Median Coordinates: {median_coords}")
-    print(f"Total Distance: {total_distance} miles")
+    result = get_geometric_median_from_file(JSON_path)
+    print(f"Geometric Median Coordinates: {result['median']}")
+    print(
+        f"Total Distance: {result['total_distance_km']:.1f} km "
+        f"({result['total_distance_miles']:.1f} miles)"
+    )
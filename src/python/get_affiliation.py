@@ -1,58 +1,90 @@
+import hashlib
 import os
 import sys
-import tempfile
+from functools import lru_cache
+from typing import Optional
 
 from unidecode import unidecode
 from openai import OpenAI
+from openai.types.chat import ChatCompletionMessageParam
+from openai.types.chat.chat_completion_content_part_param import FileFile
 
 import extract_first_page_of_pdf
 
-client = OpenAI()
-
 api_key = os.getenv("OPENAI_API_KEY")
 
 
-def get_affiliations(pdf_path: str) -> list[tuple[str, str]]:
+AFFILIATION_MODEL = "gpt-4.1"
+AFFILIATION_PROMPT = (
+    "Return the following data ONLY. For this PDF, for each author, on one line:\n"
+    " 1. The author name.\n"
+    " 2. A separator, specifically: '---'\n"
+    ' 3. The author\'s "main" affiliation. If multiple affiliations are present but no clear main one, just return the first one. Include the city name and country.\n'
+    "Separate each author's data with a newline."
+)
+TEXT_PROMPT_PREFIX = "This is the text of the first page of a paper PDF:\n\n"
+# Identifies the model and prompts, so results cached for other ones are not reused.
+EXTRACTION_VERSION = hashlib.sha256(
+    "\0".join([AFFILIATION_MODEL, AFFILIATION_PROMPT, TEXT_PROMPT_PREFIX]).encode()
+).hexdigest()[:16]
+# Below this many characters of text, the first page is considered scanned, and the PDF
+# itself is sent so the model can read it. The same goes for text that is mostly not
+# letters, as extracted from fonts with a broken encoding.
+MIN_TEXT_LENGTH = 200
+MIN_LETTER_RATIO = 0.5
+
+
+def is_usable_text(text: str) -> bool:
     """
-    Sends the extracted text from the first page of a PDF file to the OpenAI API to get the affiliation.
+    Tells whether the text extracted from a first page can be sent instead of the page.
+    """
+    characters = "".join(text.split())
+    if len(characters) < MIN_TEXT_LENGTH:
+        return False
+    letters = sum(c.isascii() and c.isalpha() for c in characters)
+    return letters / len(characters) >= MIN_LETTER_RATIO
+
+
+def build_affiliation_messages(
+    file_part: FileFile,
+) -> list[ChatCompletionMessageParam]:
+    """
+    Builds the chat messages asking for the affiliations of the authors of a PDF.
 
     Args:
-        pdf (str): The path to the input PDF file.
+        file_part (FileFile): The "file" field of the content part holding the PDF, either
+            an uploaded file ID or inline file data.
+    """
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "file", "file": file_part},
+                {"type": "text", "text": AFFILIATION_PROMPT},
+            ],
+        }
+    ]
 
-    Returns:
-        str: The affiliation extracted from the PDF.
+
+def build_affiliation_text_messages(text: str) -> list[ChatCompletionMessageParam]:
     """
+    Builds the chat messages asking for the affiliations of the authors of a paper,
+    from the text of its first page.
+    """
+    return [
+        {
+            "role": "user",
+            "content": f"{TEXT_PROMPT_PREFIX}{text}\n\n{AFFILIATION_PROMPT}",
+        }
+    ]
 
-    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
-        temp_pdf_path = tmp.name
-        extract_first_page_of_pdf.extract_first_page_of_pdf(pdf_path, temp_pdf_path)
-        file = client.files.create(file=open(tmp.name, "rb"), purpose="user_data")
-
-    response = client.chat.completions.create(
-        model="gpt-4.1",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "file", "file": {"file_id": file.id}},
-                    {
-                        "type": "text",
-                        "text": (
-                            "Return the following data ONLY. For this PDF, for each author, on one line:\n"
-                            " 1. The author name.\n"
-                            " 2. A separator, specifically: '---'\n"
-                            ' 3. The author\'s "main" affiliation. If multiple affiliations are present but no clear main one, just return the first one. Include the city name and country.\n'
-                            "Separate each author's data with a newline."
-                        ),
-                    },
-                ],
-            }
-        ],
-    )
-    client.files.delete(file.id)
 
+def parse_affiliations(content: str) -> list[tuple[str, str]]:
+    """
+    Parses the model's answer into (author name, affiliation) pairs.
+    """
     results = []
-    for line in str(response.choices[0].message.content).splitlines():
+    for line in content.splitlines():
         if line.strip():
             parts = line.split("---")
             assert len(parts) == 2
@@ -66,6 +98,53 @@ def get_affiliations(pdf_path: str) -> list[tuple[str, str]]:
     return results
 
 
+@lru_cache(maxsize=None)
+def get_default_client() -> OpenAI:
+    """
+    Returns the client configured from the environment, creating it on first use so
+    that importing this module does not need an API key.
+    """
+    return OpenAI()
+
+
+def get_affiliations(
+    pdf_path: str, openai_client: Optional[OpenAI] = None
+) -> list[tuple[str, str]]:
+    """
+    Sends the extracted text from the first page of a PDF file to the OpenAI API to get the affiliation.
+    If the page has no text, as in scanned papers, the page itself is uploaded.
+
+    Args:
+        pdf (str): The path to the input PDF file.
+        openai_client (OpenAI): The client to use instead of the default one.
+
+    Returns:
+        str: The affiliation extracted from the PDF.
+    """
+    openai_client = openai_client or get_default_client()
+
+    text = extract_first_page_of_pdf.extract_first_page_text(pdf_path)
+    if is_usable_text(text):
+        response = openai_client.chat.completions.create(
+            model=AFFILIATION_MODEL,
+            messages=build_affiliation_text_messages(text),
+        )
+        return parse_affiliations(str(response.choices[0].message.content))
+
+    # Scanned papers have no text to extract, upload the first page instead.
+    first_page = extract_first_page_of_pdf.extract_first_page_of_pdf_to_bytes(pdf_path)
+    file = openai_client.files.create(
+        file=(os.path.basename(pdf_path), first_page), purpose="user_data"
+    )
+    response = openai_client.chat.completions.create(
+        model=AFFILIATION_MODEL,
+        messages=build_affiliation_messages({"file_id": file.id}),
+    )
+    openai_client.files.delete(file.id)
+
+    return parse_affiliations(str(response.choices[0].message.content))
+
+
 if __name__ == "__main__":
     if len(sys.argv) != 2:
         print("Usage: python get_affiliation.py <input_pdf_path>")
@@ -1,9 +1,46 @@
 import sys
 import os
+from functools import lru_cache
+from typing import Any, Optional, TypedDict
 from geopy.geocoders import GoogleV3  # type: ignore
 
-api_key = os.getenv("GEOCODING_API_KEY")
-geolocator = GoogleV3(api_key)
+GEOCODING_PROVIDER = "GoogleV3"
+
+
+class GeocodingResult(TypedDict):
+    latitude: float
+    longitude: float
+    address: str
+
+
+@lru_cache(maxsize=None)
+def get_geolocator() -> Any:
+    """
+    Returns the geocoder, creating it on first use so that importing this module does
+    not need an API key.
+    """
+    return GoogleV3(os.getenv("GEOCODING_API_KEY"))
+
+
+def geocode_affiliation(affiliation: str) -> Optional[GeocodingResult]:
+    """
+    Geocode an affiliation string.
+
+    Args:
+        affiliation: The affiliation string to geocode.
+    Returns:
+        The coordinates and the address the provider matched, or None if the provider
+        does not know the affiliation. Other provider errors are raised.
+    """
+
+    location = get_geolocator().geocode(affiliation)
+    if not location:
+        return None
+    return {
+        "latitude": location.latitude,
+        "longitude": location.longitude,
+        "address": location.address,
+    }
 
 
 def get_coords_from_affiliation(affiliation: str) -> tuple[float, float]:
@@ -16,9 +53,9 @@ def get_coords_from_affiliation(affiliation: str) -> tuple[float, float]:
         A tuple containing latitude and longitude.
     """
 
-    location = geolocator.geocode(affiliation)
+    location = geocode_affiliation(affiliation)
     if location:
-        return location.latitude, location.longitude
+        return location["latitude"], location["longitude"]
     else:
         raise Exception(f"Location not found: {affiliation}")
 
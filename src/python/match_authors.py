@@ -0,0 +1,85 @@
+import re
+from typing import TypedDict
+
+import numpy as np
+import numpy.typing as npt
+from scipy.optimize import linear_sum_assignment  # type: ignore
+from unidecode import unidecode
+
+# Similarities closer than this are considered equal.
+TIE_TOLERANCE = 1e-9
+
+
+class AuthorMatching(TypedDict):
+    # Index into the extracted names for each matched dblp author.
+    assignment: dict[str, int]
+    # Authors without a match, or whose match is tied with another candidate.
+    problems: list[str]
+
+
+def _bigrams(name: str) -> list[str]:
+    text = f" {' '.join(re.findall(r'[a-z]+', unidecode(name).lower()))} "
+    return [text[i : i + 2] for i in range(len(text) - 1)]
+
+
+def name_similarity(names_a: list[str], names_b: list[str]) -> npt.NDArray[np.float64]:
+    """
+    Computes the cosine similarity between the character bigram counts of every pair
+    of names, as one matrix product.
+
+    Returns a len(names_a) x len(names_b) matrix of similarities between 0 and 1.
+    """
+    vocabulary: dict[str, int] = {}
+    counts = []
+    for names in (names_a, names_b):
+        rows, cols = [], []
+        for row, name in enumerate(names):
+            for bigram in _bigrams(name):
+                rows.append(row)
+                cols.append(vocabulary.setdefault(bigram, len(vocabulary)))
+        counts.append((len(names), rows, cols))
+
+    vectors = []
+    for n_names, rows, cols in counts:
+        matrix = np.zeros((n_names, max(len(vocabulary), 1)))
+        np.add.at(matrix, (rows, cols), 1.0)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        vectors.append(matrix / np.where(norms > 0, norms, 1.0))
+    return np.asarray(vectors[0] @ vectors[1].T, dtype=np.float64)
+
+
+def match_authors(authors: list[str], extracted_names: list[str]) -> AuthorMatching:
+    """
+    Matches dblp authors to the author names extracted from a paper.
+
+    The matching maximizing the total name similarity is found with the Hungarian
+    algorithm, so each extracted name is used at most once. A match is reported as a
+    problem instead when another candidate for the same author or the same extracted
+    name is exactly as similar, since the choice between them would be arbitrary.
+    """
+    if not authors or not extracted_names:
+        return {
+            "assignment": {},
+            "problems": [f"{author}: no extracted name to match" for author in authors],
+        }
+
+    similarity = name_similarity(authors, extracted_names)
+    rows, cols = linear_sum_assignment(similarity, maximize=True)
+
+    assignment: dict[str, int] = {}
+    problems: list[str] = []
+    for row, col in zip(rows, cols):
+        score = similarity[row, col]
+        others = np.concatenate(
+            [np.delete(similarity[row], col), np.delete(similarity[:, col], row)]
+        )
+        if np.any(np.abs(others - score) <= TIE_TOLERANCE):
+            problems.append(
+                f"{authors[row]}: tied between {extracted_names[col]} and another "
+                f"candidate ({score:.2f})"
+            )
+            continue
+        assignment[authors[row]] = int(col)
+    for row in sorted(set(range(len(authors))) - set(rows)):
+        problems.append(f"{authors[row]}: no extracted name left to match")
+    return {"assignment": assignment, "problems": problems}
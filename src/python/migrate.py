@@ -0,0 +1,254 @@
+import argparse
+
+import psycopg2
+
+from database_connection import get_connection
+
+# --- SCHEMA MIGRATIONS ---
+# Each migration is applied once, in order, and recorded in schema_migrations under
+# its position in this list, starting at 1. Never edit or reorder applied migrations,
+# append new ones instead.
+# The first ones create the tables with IF NOT EXISTS, so databases created before
+# migrations existed are brought up to date instead of failing.
+
+MIGRATIONS: list[tuple[str, str]] = [
+    (
+        "Create initial tables",
+        """
+        CREATE TABLE IF NOT EXISTS conference_happenings (
+            conference_short_name VARCHAR(50) NOT NULL,
+            year INTEGER NOT NULL,
+            city VARCHAR(255) NOT NULL,
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            PRIMARY KEY (conference_short_name, year)
+        );
+        CREATE TABLE IF NOT EXISTS papers (
+            doi VARCHAR(255) PRIMARY KEY,
+            title TEXT,
+            conference_short_name VARCHAR(50),
+            conference_year INTEGER,
+            dblp_pub_id VARCHAR(255),
+            manually_edited BOOLEAN DEFAULT FALSE NOT NULL,
+            FOREIGN KEY(conference_short_name, conference_year) REFERENCES conference_happenings(conference_short_name, year)
+        );
+        CREATE TABLE IF NOT EXISTS affiliations (
+            affiliation_name VARCHAR(255) PRIMARY KEY,
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            manually_edited BOOLEAN DEFAULT FALSE NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS paper_affiliations (
+            paper_doi VARCHAR(255) REFERENCES papers(doi),
+            author_name VARCHAR(255),
+            affiliation_name VARCHAR(255) REFERENCES affiliations(affiliation_name),
+            PRIMARY KEY (paper_doi, author_name)
+        );
+        """,
+    ),
+    (
+        "Store dblp author lists",
+        """
+        CREATE TABLE IF NOT EXISTS paper_authors (
+            paper_doi VARCHAR(255) REFERENCES papers(doi),
+            position INTEGER NOT NULL,
+            author_name VARCHAR(255) NOT NULL,
+            PRIMARY KEY (paper_doi, position)
+        );
+        """,
+    ),
+    (
+        "Cache geocoding results",
+        """
+        CREATE TABLE IF NOT EXISTS geocoding_cache (
+            query TEXT PRIMARY KEY,
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            found BOOLEAN NOT NULL,
+            provider VARCHAR(50) NOT NULL,
+            address TEXT NOT NULL,
+            fetched_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+        """,
+    ),
+    (
+        "Cache extracted affiliations",
+        """
+        CREATE TABLE IF NOT EXISTS affiliation_cache (
+            pdf_sha256 CHAR(64) NOT NULL,
+            extraction_version CHAR(16) NOT NULL,
+            model VARCHAR(50) NOT NULL,
+            affiliations JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (pdf_sha256, extraction_version)
+        );
+        """,
+    ),
+    (
+        "Add the ingestion job queue",
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            kind VARCHAR(50) NOT NULL,
+            job_key VARCHAR(255) NOT NULL,
+            conference_short_name VARCHAR(50) NOT NULL,
+            conference_year INTEGER NOT NULL,
+            status VARCHAR(20) DEFAULT 'pending' NOT NULL,
+            attempts INTEGER DEFAULT 0 NOT NULL,
+            available_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            worker VARCHAR(255),
+            leased_until TIMESTAMP WITH TIME ZONE,
+            last_error TEXT,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            PRIMARY KEY (kind, job_key)
+        );
+        CREATE INDEX IF NOT EXISTS jobs_claim_idx
+            ON jobs (kind, conference_short_name, conference_year, status);
+        """,
+    ),
+    (
+        "Index the columns that papers and affiliations are looked up by",
+        """
+        CREATE INDEX IF NOT EXISTS papers_happening_idx
+            ON papers (conference_short_name, conference_year);
+        CREATE INDEX IF NOT EXISTS paper_affiliations_affiliation_idx
+            ON paper_affiliations (affiliation_name);
+        """,
+    ),
+    (
+        "Add the materialized view of submissions exported per happening",
+        """
+        CREATE MATERIALIZED VIEW happening_submissions AS
+        SELECT
+            p.conference_short_name,
+            p.conference_year,
+            p.doi AS paper_doi,
+            p_a.author_name,
+            aff.affiliation_name,
+            aff.latitude,
+            aff.longitude
+        FROM
+            papers AS p
+        JOIN
+            paper_affiliations AS p_a ON p_a.paper_doi = p.doi
+        JOIN
+            affiliations AS aff ON p_a.affiliation_name = aff.affiliation_name;
+        -- Required to refresh the view without blocking readers.
+        CREATE UNIQUE INDEX happening_submissions_key_idx
+            ON happening_submissions (paper_doi, author_name);
+        CREATE INDEX happening_submissions_happening_idx
+            ON happening_submissions (conference_short_name, conference_year);
+        """,
+    ),
+]
+
+# Arbitrary key of the lock serializing concurrent migration runs.
+MIGRATION_LOCK_KEY = 20250701
+
+
+def get_applied_versions(cursor: psycopg2.extensions.cursor) -> set[int]:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+        )
+        """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {version for (version,) in cursor.fetchall()}
+
+
+def migrate(connection: psycopg2.extensions.connection) -> int:
+    """
+    Applies the pending migrations, each in its own transaction.
+
+    Returns the number of migrations applied.
+    """
+    cursor = connection.cursor()
+    # Only one runner at a time, the others wait and then find nothing left to do.
+    cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        applied = get_applied_versions(cursor)
+        connection.commit()
+        count = 0
+        for version, (name, sql) in enumerate(MIGRATIONS, start=1):
+            if version in applied:
+                continue
+            print(f"Applying migration {version}: {name}")
+            cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
+            connection.commit()
+            count += 1
+        return count
+    finally:
+        connection.rollback()
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        connection.commit()
+        cursor.close()
+
+
+def refresh_export_view(cursor: psycopg2.extensions.cursor) -> None:
+    """
+    Recomputes the submissions exported per happening. Should be called once
+    affiliations were added or changed. Readers are not blocked meanwhile.
+    """
+    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY happening_submissions")
+
+
+def reset(cursor: psycopg2.extensions.cursor) -> None:
+    """
+    Drops everything created by the migrations, data included.
+    """
+    cursor.execute("""
+        DROP MATERIALIZED VIEW IF EXISTS happening_submissions;
+        DROP TABLE IF EXISTS paper_affiliations;
+        DROP TABLE IF EXISTS paper_authors;
+        DROP TABLE IF EXISTS affiliations;
+        DROP TABLE IF EXISTS geocoding_cache;
+        DROP TABLE IF EXISTS affiliation_cache;
+        DROP TABLE IF EXISTS jobs;
+        DROP TABLE IF EXISTS papers;
+        DROP TABLE IF EXISTS conference_happenings;
+        DROP TABLE IF EXISTS conferences;
+        DROP TABLE IF EXISTS schema_migrations;
+        """)
+
+
+def main(args: argparse.Namespace) -> None:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if args.command == "up":
+            count = migrate(conn)
+            print(
+                f"Applied {count} migrations, the schema is at version {len(MIGRATIONS)}."
+            )
+        elif args.command == "status":
+            applied = get_applied_versions(cursor)
+            for version, (name, _) in enumerate(MIGRATIONS, start=1):
+                print(f"{'[x]' if version in applied else '[ ]'} {version}: {name}")
+        elif args.command == "refresh":
+            refresh_export_view(cursor)
+            print("Refreshed happening_submissions.")
+        elif args.yes:
+            reset(cursor)
+            print("Dropped all tables.")
+        else:
+            print("This drops all tables and their data, pass --yes to confirm.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the database schema")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="up",
+        choices=["up", "status", "refresh", "reset"],
+        help=(
+            "Apply pending migrations (default), list migrations, refresh the "
+            "materialized views, or drop all tables"
+        ),
+    )
+    parser.add_argument("--yes", action="store_true", help="Confirm reset")
+    main(parser.parse_args())
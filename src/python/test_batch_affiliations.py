@@ -0,0 +1,139 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from typing import Any, cast
+from unittest import mock
+
+from openai import OpenAI
+from pypdf import PdfWriter
+
+from batch_affiliations import (
+    build_batch_request,
+    create_client,
+    get_batch_results,
+    submit_batch,
+    wait_for_batch,
+)
+
+ANSWERS = {
+    "10.1/a": "Alice Smith --- Stanford University, Stanford, CA, USA",
+    "10.1/b": "",
+}
+
+
+class FakeFiles:
+    def __init__(self) -> None:
+        self.contents: dict[str, bytes] = {}
+
+    def create(self, file: tuple[str, bytes], purpose: str) -> Any:
+        file_id = f"file-{len(self.contents)}"
+        self.contents[file_id] = file[1]
+        return SimpleNamespace(id=file_id)
+
+    def content(self, file_id: str) -> Any:
+        return SimpleNamespace(text=self.contents[file_id].decode())
+
+    def delete(self, file_id: str) -> None:
+        del self.contents[file_id]
+
+
+class FakeBatches:
+    """
+    Answers every request of a batch at once, failing those without an answer.
+    """
+
+    def __init__(self, files: FakeFiles) -> None:
+        self.files = files
+        self.batches: dict[str, Any] = {}
+
+    def create(self, input_file_id: str, **kwargs: Any) -> Any:
+        output, errors = [], []
+        for line in self.files.contents[input_file_id].decode().splitlines():
+            doi = json.loads(line)["custom_id"]
+            if doi in ANSWERS:
+                content = {"choices": [{"message": {"content": ANSWERS[doi]}}]}
+                response = {"status_code": 200, "body": content}
+                output.append({"custom_id": doi, "response": response})
+            else:
+                response = {"status_code": 400, "body": {"error": "bad request"}}
+                errors.append({"custom_id": doi, "response": response})
+        for name, lines in (("output", output), ("error", errors)):
+            data = "".join(json.dumps(line) + "\n" for line in lines).encode()
+            self.files.contents[name] = data
+        batch = SimpleNamespace(
+            id=f"batch-{len(self.batches)}",
+            status="completed",
+            request_counts=None,
+            input_file_id=input_file_id,
+            output_file_id="output",
+            error_file_id="error",
+        )
+        self.batches[batch.id] = batch
+        return batch
+
+    def retrieve(self, batch_id: str) -> Any:
+        return self.batches[batch_id]
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.files = FakeFiles()
+        self.batches = FakeBatches(self.files)
+
+
+def write_blank_pdf(path: str) -> None:
+    writer = PdfWriter()
+    writer.add_blank_page(100, 100)
+    writer.write(path)
+
+
+class BatchAffiliationsTest(unittest.TestCase):
+    def test_import_without_credentials(self) -> None:
+        env = {
+            name: value
+            for name, value in os.environ.items()
+            if name not in ("OPENAI_API_KEY", "GEOCODING_API_KEY")
+        }
+        subprocess.run(
+            [sys.executable, "-c", "import batch_affiliations"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            check=True,
+        )
+
+    def test_base_url_without_credentials(self) -> None:
+        with mock.patch.dict(os.environ):
+            os.environ.pop("OPENAI_API_KEY", None)
+            client = create_client("http://127.0.0.1:8000/v1")
+        self.assertEqual(str(client.base_url), "http://127.0.0.1:8000/v1/")
+
+    def test_batch_with_fake_client(self) -> None:
+        client = cast(OpenAI, FakeClient())
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(os.environ):
+            os.environ.pop("OPENAI_API_KEY", None)
+            os.environ.pop("GEOCODING_API_KEY", None)
+            requests = []
+            for doi in ("10.1/a", "10.1/b", "10.1/c"):
+                path = os.path.join(directory, f"{doi.replace('/', '_')}.pdf")
+                write_blank_pdf(path)
+                requests.append(build_batch_request(doi, path))
+            batch = submit_batch(client, requests, "TST 2030")
+            batch = wait_for_batch(client, batch.id, poll_interval=0)
+            results, failures = get_batch_results(client, batch)
+
+        self.assertEqual(
+            results,
+            {
+                "10.1/a": [("Alice Smith", "Stanford University, Stanford, CA, USA")],
+                "10.1/b": [],
+            },
+        )
+        self.assertEqual(list(failures), ["10.1/c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
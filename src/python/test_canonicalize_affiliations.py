@@ -0,0 +1,115 @@
+import unittest
+from typing import Optional
+
+from canonicalize_affiliations import AffiliationIndex, canonicalize, split_affiliation
+
+PEKING = "School of Computer Science, Peking University, Beijing, China"
+STANFORD = "Computer Science Department, Stanford University, Stanford, CA, USA"
+MIT = "Massachusetts Institute of Technology, Cambridge, MA, USA"
+
+COORDS = {
+    PEKING: (39.99, 116.31),
+    STANFORD: (37.43, -122.17),
+    MIT: (42.36, -71.09),
+    "MIT, Cambridge, USA": (42.36, -71.09),
+    # Geocoded to a different campus.
+    "Massachusetts Inst. of Technology, Cambridge, USA": (32.88, -117.23),
+}
+
+
+def locate(affiliations: list[str]) -> dict[str, Optional[tuple[float, float]]]:
+    return {affiliation: COORDS.get(affiliation) for affiliation in affiliations}
+
+
+def build_index() -> AffiliationIndex:
+    index = AffiliationIndex()
+    for name in (PEKING, STANFORD, MIT):
+        index.add(name)
+    return index
+
+
+class SplitAffiliationTest(unittest.TestCase):
+    def test_department_before_university(self) -> None:
+        self.assertEqual(
+            split_affiliation(
+                "School of Computer Science, Fudan University, Shanghai, China"
+            ),
+            (["fudan", "university"], "shanghai"),
+        )
+        self.assertEqual(
+            split_affiliation(
+                "Computer Science Department, Princeton University, Princeton, NJ, USA"
+            ),
+            (["princeton", "university"], "princeton"),
+        )
+
+    def test_college_inside_institute(self) -> None:
+        self.assertEqual(
+            split_affiliation(
+                "College of Computing, Georgia Institute of Technology, Atlanta, USA"
+            ),
+            (["georgia", "institute", "technology"], "atlanta"),
+        )
+
+    def test_city_with_institution_word(self) -> None:
+        self.assertEqual(
+            split_affiliation("University of Maryland, College Park, MD, USA"),
+            (["university", "maryland"], "college park"),
+        )
+
+    def test_without_institution_word(self) -> None:
+        self.assertEqual(
+            split_affiliation("Department of Computer Science, ETH Zurich, Zurich"),
+            (["eth", "zurich"], "zurich"),
+        )
+        self.assertEqual(
+            split_affiliation("Microsoft Research, Redmond, WA, USA"),
+            (["microsoft", "research"], "redmond"),
+        )
+
+
+class AffiliationIndexTest(unittest.TestCase):
+    def test_other_universities_do_not_match(self) -> None:
+        index = build_index()
+        self.assertIsNone(
+            index.match("School of Computer Science, Fudan University, Shanghai, China")
+        )
+        self.assertIsNone(
+            index.match(
+                "Computer Science Department, Princeton University, Princeton, NJ, USA"
+            )
+        )
+
+    def test_same_university_matches(self) -> None:
+        index = build_index()
+        self.assertEqual(
+            index.match("Dept. of Computer Science, Stanford Univ., Stanford, USA"),
+            STANFORD,
+        )
+        self.assertEqual(index.match("MIT, Cambridge, USA"), MIT)
+
+    def test_whole_city_must_match(self) -> None:
+        index = AffiliationIndex()
+        index.add("Saint Louis University, Saint Louis, USA")
+        self.assertIsNone(index.match("Saint Louis University, Saint Paul, USA"))
+
+
+class CanonicalizeTest(unittest.TestCase):
+    def test_match_within_merge_distance(self) -> None:
+        canonical = canonicalize(build_index(), ["MIT, Cambridge, USA"], locate)
+        self.assertEqual(canonical, {"MIT, Cambridge, USA": MIT})
+
+    def test_match_too_far_is_kept(self) -> None:
+        index = build_index()
+        name = "Massachusetts Inst. of Technology, Cambridge, USA"
+        self.assertEqual(index.match(name), MIT)
+        self.assertEqual(canonicalize(index, [name], locate), {name: name})
+        self.assertEqual(index.match(name), name)
+
+    def test_match_without_coordinates_is_kept(self) -> None:
+        name = "Dept. of Computer Science, Stanford Univ., Stanford, USA"
+        self.assertEqual(canonicalize(build_index(), [name], locate), {name: name})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+import argparse
+import os
+import socket
+from datetime import timedelta
+
+import psycopg2
+
+from database_connection import get_connection
+
+# Kinds of jobs, one per ingestion step. Job keys are dblp publication IDs for the
+# first one, and paper DOIs for the others.
+DBLP_DETAILS_JOB = "dblp_details"
+ACM_PDF_JOB = "acm_pdf"
+AFFILIATIONS_JOB = "affiliations"
+
+# A claimed job is given back to the queue if its worker did not finish it in time,
+# for example because it crashed.
+DEFAULT_LEASE = timedelta(minutes=10)
+# Jobs failing this many times are left for a human to look at.
+MAX_ATTEMPTS = 3
+# Failed jobs are retried after this delay, times the number of attempts so far.
+RETRY_DELAY = timedelta(minutes=5)
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_jobs(
+    cursor: psycopg2.extensions.cursor,
+    kind: str,
+    conference: str,
+    year: int,
+    keys: list[str],
+) -> int:
+    """
+    Adds jobs to the queue, leaving the ones already there as they are, so that
+    restarting a worker does not redo finished jobs.
+
+    Returns the number of new jobs.
+    """
+    cursor.execute(
+        """
+        INSERT INTO jobs (kind, job_key, conference_short_name, conference_year)
+        SELECT %(kind)s, key, %(conference)s, %(year)s
+        FROM unnest(%(keys)s::text[]) AS key
+        ON CONFLICT (kind, job_key) DO NOTHING
+        """,
+        {"kind": kind, "conference": conference, "year": year, "keys": keys},
+    )
+    return cursor.rowcount
+
+
+def claim_jobs(
+    cursor: psycopg2.extensions.cursor,
+    kind: str,
+    conference: str,
+    year: int,
+    limit: int = 1,
+    lease: timedelta = DEFAULT_LEASE,
+) -> list[str]:
+    """
+    Claims up to limit pending jobs, or jobs whose lease expired, for this worker.
+
+    Jobs locked by another worker's claim are skipped rather than waited for, so any
+    number of workers can claim from the same conference at once. The claim should
+    be committed right away, for the other workers to see it.
+
+    Returns the keys of the claimed jobs.
+    """
+    # Jobs whose worker ran out of attempts without reporting back failed for good.
+    cursor.execute(
+        """
+        UPDATE jobs
+        SET status = 'failed', leased_until = NULL, updated_at = now(),
+            last_error = COALESCE(last_error, 'Lease expired')
+        WHERE kind = %(kind)s
+            AND conference_short_name = %(conference)s AND conference_year = %(year)s
+            AND status = 'running' AND leased_until < now()
+            AND attempts >= %(max_attempts)s
+        """,
+        {
+            "kind": kind,
+            "conference": conference,
+            "year": year,
+            "max_attempts": MAX_ATTEMPTS,
+        },
+    )
+    cursor.execute(
+        """
+        UPDATE jobs
+        SET status = 'running', attempts = attempts + 1, worker = %(worker)s,
+            leased_until = now() + %(lease)s, updated_at = now()
+        WHERE (kind, job_key) IN (
+            SELECT kind, job_key
+            FROM jobs
+            WHERE kind = %(kind)s
+                AND conference_short_name = %(conference)s
+                AND conference_year = %(year)s
+                AND (
+                    (status = 'pending' AND available_at <= now())
+                    OR (status = 'running' AND leased_until < now())
+                )
+            ORDER BY job_key
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING job_key
+        """,
+        {
+            "kind": kind,
+            "conference": conference,
+            "year": year,
+            "worker": worker_name(),
+            "lease": lease,
+            "limit": limit,
+        },
+    )
+    return sorted(key for (key,) in cursor.fetchall())
+
+
+def complete_job(cursor: psycopg2.extensions.cursor, kind: str, key: str) -> None:
+    cursor.execute(
+        """
+        UPDATE jobs
+        SET status = 'done', leased_until = NULL, last_error = NULL, updated_at = now()
+        WHERE kind = %s AND job_key = %s
+        """,
+        (kind, key),
+    )
+
+
+def fail_job(
+    cursor: psycopg2.extensions.cursor,
+    kind: str,
+    key: str,
+    error: str,
+    retry: bool = True,
+) -> None:
+    """
+    Records the failure of a job. It goes back to the queue, to be retried after a
+    delay, unless it should not be retried or ran out of attempts.
+    """
+    cursor.execute(
+        """
+        UPDATE jobs
+        SET status = CASE
+                WHEN %(retry)s AND attempts < %(max_attempts)s THEN 'pending'
+                ELSE 'failed'
+            END,
+            available_at = now() + attempts * %(retry_delay)s,
+            leased_until = NULL, last_error = %(error)s, updated_at = now()
+        WHERE kind = %(kind)s AND job_key = %(key)s
+        """,
+        {
+            "kind": kind,
+            "key": key,
+            "error": error,
+            "retry": retry,
+            "max_attempts": MAX_ATTEMPTS,
+            "retry_delay": RETRY_DELAY,
+        },
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        filters = {"conference": args.conference, "year": args.year, "kind": args.kind}
+        condition = """
+            conference_short_name = %(conference)s AND conference_year = %(year)s
+            AND (%(kind)s::text IS NULL OR kind = %(kind)s)
+        """
+        if args.command == "status":
+            cursor.execute(
+                f"""
+                SELECT kind, status, COUNT(*)
+                FROM jobs
+                WHERE {condition}
+                GROUP BY kind, status
+                ORDER BY kind, status
+                """,
+                filters,
+            )
+            for kind, status, count in cursor.fetchall():
+                print(f"{kind} {status}: {count}")
+            cursor.execute(
+                f"""
+                SELECT kind, job_key, attempts, available_at, last_error
+                FROM jobs
+                WHERE {condition} AND status = 'pending' AND attempts > 0
+                ORDER BY kind, job_key
+                """,
+                filters,
+            )
+            for kind, key, attempts, available_at, last_error in cursor.fetchall():
+                print(
+                    f"[RETRY] {kind} {key} after {attempts} attempts, from {available_at}: "
+                    f"{last_error}"
+                )
+            cursor.execute(
+                f"""
+                SELECT kind, job_key, attempts, last_error
+                FROM jobs
+                WHERE {condition} AND status = 'failed'
+                ORDER BY kind, job_key
+                """,
+                filters,
+            )
+            for kind, key, attempts, last_error in cursor.fetchall():
+                print(f"[FAILED] {kind} {key} after {attempts} attempts: {last_error}")
+        elif args.command == "retry":
+            cursor.execute(
+                f"""
+                UPDATE jobs
+                SET status = 'pending', attempts = 0, available_at = now(),
+                    updated_at = now()
+                WHERE {condition}
+                    AND (status = 'failed' OR (status = 'pending' AND attempts > 0))
+                """,
+                filters,
+            )
+            print(f"Requeued {cursor.rowcount} failed jobs.")
+        else:
+            cursor.execute(f"DELETE FROM jobs WHERE {condition}", filters)
+            print(f"Removed {cursor.rowcount} jobs.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Inspect and manage the ingestion job queue of a conference"
+    )
+    parser.add_argument(
+        "command",
+        choices=["status", "retry", "clear"],
+        help="Show job counts and failures, retry failed jobs now, or remove all jobs",
+    )
+    parser.add_argument("--conference", type=str, required=True)
+    parser.add_argument("--year", type=int, required=True)
+    parser.add_argument(
+        "--kind",
+        choices=[DBLP_DETAILS_JOB, ACM_PDF_JOB, AFFILIATIONS_JOB],
+        help="Only consider jobs of this kind",
+    )
+    main(parser.parse_args())
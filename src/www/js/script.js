@@ -39,22 +39,25 @@ async function doFetch(json_name) {
   const response = await fetch("./" + json_name);
   const data = await response.json();
 
+  // Submissions reference the affiliations table by index (see db_to_jsonFORMAT.md).
+  const affiliations = data.affiliations;
   const submissions = data.happenings[0].submissions;
 
   for (let i = 0; i < submissions.length; i++) {
+    const [author_name, affiliation] = submissions[i];
     features.push({
       type: "Feature",
       properties: {
         name:
-          submissions[i].author_name +
+          author_name +
           " (" +
-          submissions[i].affiliation_name.split(",")[0] +
+          affiliations.name[affiliation].split(",")[0] +
           ")",
       },
       geometry: {
         coordinates: [
-          submissions[i].location.longitude,
-          submissions[i].location.latitude,
+          affiliations.longitude[affiliation],
+          affiliations.latitude[affiliation],
         ],
         type: "Point",
       },